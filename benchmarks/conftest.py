@@ -0,0 +1,97 @@
+import asyncio
+import json
+import pytest
+import yaml
+from sqlmodel import Field, Session
+from starlette.requests import Request
+
+from mozi.db import BaseModel, TestDatabase
+
+
+class Item(BaseModel, table=True):
+    __tablename__ = "bench_items"
+
+    name: str = Field(index=True)
+    price: int = Field(default=0)
+    description: str = Field(default='')
+
+
+ROWS = 1000
+
+
+def make_config(loggers: int = 200, depth: int = 5) -> dict:
+    """ A layered config: many loggers plus a deeply nested section. """
+    nested: dict = {'value': 0}
+    for i in range(depth):
+        nested = {f'level{i}': nested, f'key{i}': list(range(10))}
+
+    return {
+        'logging': {
+            'log_path': '/tmp/logs/mozi-bench',
+            'formatters': {'default': {'format': '%(message)s'}},
+            'loggers': {
+                f'bench.logger{i}': {'handlers': ['console'], 'level': 'INFO'}
+                for i in range(loggers)
+            },
+        },
+        'nested': nested,
+        'services': {f'service{i}': {'host': f'10.0.0.{i}', 'port': 8000 + i} for i in range(200)},
+    }
+
+
+@pytest.fixture(scope='session', name='database')
+def fixture_database():
+    database = TestDatabase()
+    with Session(database.engine) as session:
+        session.add_all([Item(name=f'item{i}', price=i, description='x' * 64) for i in range(ROWS)])
+        session.commit()
+    yield database
+    database.dispose()
+
+
+@pytest.fixture(name='session')
+def fixture_session(database):
+    session = database.session()
+    yield session
+    database.rollback(session)
+
+
+@pytest.fixture
+def config_files(tmp_path):
+    config = make_config()
+    base, overlay = tmp_path / 'base.yml', tmp_path / 'overlay.yml'
+    base.write_text(yaml.safe_dump(config), encoding='utf-8')
+
+    config['logging']['loggers'] = {
+        f'bench.logger{i}': {'level': 'DEBUG'} for i in range(0, 200, 2)
+    }
+    overlay.write_text(yaml.safe_dump(config), encoding='utf-8')
+    return [str(base), str(overlay)]
+
+
+@pytest.fixture
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def make_request(path: str = '/items', query: str = 'limit=20', body: bytes = b'') -> Request:
+    scope = {
+        'type': 'http',
+        'method': 'POST' if body else 'GET',
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [(b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+        'scheme': 'http',
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return Request(scope, receive)
+
+
+JSON_BODY = json.dumps({'name': 'item', 'tags': list(range(20))}).encode()
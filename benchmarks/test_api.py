@@ -0,0 +1,91 @@
+import io
+import logging
+import pytest
+from fastapi import APIRouter, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from mozi.api import FastJSONResponse, LogRequestRoute
+from mozi.api import api_logger
+from mozi.api.api_logger import api_log
+from mozi.api.app import app, validation_error_handler
+from .conftest import JSON_BODY, Item, make_request
+
+router = APIRouter(prefix="/bench", route_class=LogRequestRoute)
+
+
+@router.get("/items")
+async def items(start: int = 0, limit: int = 20):
+    return [{'id': i, 'name': f'item{i}'} for i in range(start, start + limit)]
+
+
+@router.get("/validate")
+async def validate(limit: int, ids: list[int] = Query(default=[])):  # pylint: disable=unused-argument
+    return {"limit": limit}
+
+
+app.include_router(router)
+client = TestClient(app)
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_api_log(benchmark, event_loop, enabled):
+    """ Written to an in-memory stream, or skipped by the level check. """
+    logger = api_logger.logger
+    level, handlers = logger.level, logger.handlers
+    logger.setLevel(logging.INFO if enabled else logging.CRITICAL)
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+    try:
+        benchmark(lambda: event_loop.run_until_complete(api_log(make_request(), status_code=200)))
+    finally:
+        logger.setLevel(level)
+        logger.handlers = handlers
+
+
+def test_api_log_error_with_body(benchmark, event_loop):
+    def run():
+        request = make_request(body=JSON_BODY)
+        event_loop.run_until_complete(api_log(request, status_code=400, payload={'detail': 'bad'}))
+
+    benchmark(run)
+
+
+def test_get_route(benchmark):
+    response = benchmark(client.get, '/bench/items', params={'limit': 100})
+    assert response.status_code == 200
+
+
+def test_validation_error_route(benchmark):
+    params = {'limit': 'abc', 'ids': ['1', 'x', '3']}
+    response = benchmark(client.get, '/bench/validate', params=params)
+    assert response.status_code == 422
+
+
+def test_validation_error_handler(benchmark, event_loop):
+    msg = 'Input should be a valid integer'
+    exc = RequestValidationError([
+        {'loc': ('query', 'limit'), 'msg': msg, 'type': 'int_parsing'},
+        {'loc': ('query', 'ids', 1), 'msg': msg, 'type': 'int_parsing'},
+    ])
+    request = make_request()
+
+    def run():
+        return event_loop.run_until_complete(validation_error_handler(request, exc))
+
+    response = benchmark(run)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('response_class', [JSONResponse, FastJSONResponse])
+def test_render_models(benchmark, session, response_class):
+    rows = Item.all(session)
+
+    def render():
+        if response_class is JSONResponse:
+            return response_class(jsonable_encoder(rows))
+        return response_class(rows)
+
+    response = benchmark(render)
+    assert response.body.startswith(b'[{')
@@ -0,0 +1,29 @@
+from .conftest import ROWS, Item
+
+
+def test_create(benchmark, session):
+    counter = iter(range(10 ** 9))
+    benchmark(lambda: Item.create(session, name=f'new{next(counter)}', price=1))
+
+
+def test_gets(benchmark, session):
+    total, items = benchmark(Item.gets, session, start=100, limit=20, order_by='-price')
+    assert total == ROWS
+    assert len(items) == 20
+
+
+def test_all(benchmark, session):
+    items = benchmark(Item.all, session, order_by='name')
+    assert len(items) == ROWS
+
+
+def test_gets_by_ids(benchmark, session):
+    ids = list(range(ROWS, 0, -1))
+    items = benchmark(Item.gets_by_ids, session, ids, ordered=True)
+    assert len(items) == ROWS
+
+
+def test_hydration(benchmark):
+    rows = [{'id': i, 'name': f'item{i}', 'price': i, 'description': 'x' * 64} for i in range(ROWS)]
+    items = benchmark(lambda: [Item(**row) for row in rows])
+    assert len(items) == ROWS
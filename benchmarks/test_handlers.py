@@ -0,0 +1,62 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import pytest
+
+from mozi.handlers import MultiProcessRotatingFileHandler
+
+WRITERS = 4
+LINES = 5000
+RECORD = logging.makeLogRecord({'msg': 'x' * 120})
+
+
+def write_lines(log_file: str, writer: int):
+    handler = MultiProcessRotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=1000)
+    for i in range(LINES):
+        handler.emit(logging.makeLogRecord({'msg': f'{writer}-{i}'}))
+    handler.close()
+
+
+def count_lines(log_dir) -> int:
+    total = 0
+    for name in os.listdir(log_dir):
+        if not name.endswith('.lock'):
+            with open(log_dir / name, encoding='utf-8') as f:
+                total += sum(1 for _ in f)
+    return total
+
+
+@pytest.mark.parametrize('handler_class', [
+    logging.handlers.RotatingFileHandler,
+    MultiProcessRotatingFileHandler,
+])
+def test_emit(benchmark, tmp_path, handler_class):
+    handler = handler_class(str(tmp_path / 'app.log'), maxBytes=10 * 1024 * 1024, backupCount=3)
+    benchmark(handler.emit, RECORD)
+    handler.close()
+
+
+def test_multi_process_writers(benchmark, tmp_path):
+    context = multiprocessing.get_context('spawn')
+
+    def run(log_dir):
+        processes = [
+            context.Process(target=write_lines, args=(str(log_dir / 'app.log'), writer))
+            for writer in range(WRITERS)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return log_dir
+
+    counter = iter(range(10 ** 6))
+
+    def setup():
+        log_dir = tmp_path / f'run{next(counter)}'
+        log_dir.mkdir()
+        return (log_dir,), {}
+
+    log_dir = benchmark.pedantic(run, setup=setup, rounds=3)
+    assert count_lines(log_dir) == WRITERS * LINES
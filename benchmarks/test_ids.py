@@ -0,0 +1,48 @@
+import base64
+import hashlib
+from mozi.ids import short_hash, ulid, ulids, uuids
+
+NAMES = [f'user-{i}@example.com' for i in range(10000)]
+
+
+def previous_uuid(message: str, length: int = 8) -> str:
+    hash_bytes = hashlib.sha256(message.encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(hash_bytes).decode("utf-8")[:length]
+
+
+def test_uuid_previous(benchmark):
+    benchmark(lambda: [previous_uuid(name) for name in NAMES])
+
+
+def test_uuids(benchmark):
+    benchmark(uuids, NAMES)
+
+
+def test_short_hash_memoised(benchmark):
+    names = NAMES[:4000]
+    benchmark(lambda: [short_hash(name) for name in names])
+
+
+def test_ulid(benchmark):
+    benchmark(ulid)
+
+
+def test_ulids(benchmark):
+    benchmark(ulids, 10000)
+
+
+def test_collision_rate(benchmark):
+    """ Collisions of 8-char (48-bit) hashes over 1M distinct names, expected ~0.002. """
+    def collisions():
+        names = (f'user-{i}' for i in range(1_000_000))
+        return 1_000_000 - len(set(uuids(names)))
+
+    count = benchmark.pedantic(collisions, rounds=1)
+    benchmark.extra_info['collisions'] = count
+    assert count <= 1
+
+
+def test_ulid_collision_rate(benchmark):
+    count = benchmark.pedantic(lambda: 1_000_000 - len(set(ulids(1_000_000))), rounds=1)
+    benchmark.extra_info['collisions'] = count
+    assert count == 0
@@ -0,0 +1,37 @@
+import pytest
+import yaml
+from mozi.logger import LoggerLoader
+from mozi.utils import clear_ensured_dirs
+from .conftest import make_config
+
+
+def test_logger_loader_load(benchmark, config_files):
+    loader = LoggerLoader(config_files)
+    config = benchmark(loader.load)
+    assert len(config.loggers) == 200
+
+
+def test_load_500_loggers(benchmark, tmp_path):
+    """ Startup: every logger with file handlers in its own nested log directory. """
+    config = make_config(loggers=0)
+    config['logging']['log_path'] = str(tmp_path)
+    config['logging']['loggers'] = {
+        f'service{i % 10}.module{i}': {'handlers': ['rotate', 'error']} for i in range(500)
+    }
+    path = tmp_path / 'loggers.yml'
+    path.write_text(yaml.safe_dump(config), encoding='utf-8')
+
+    def load():
+        clear_ensured_dirs()
+        return LoggerLoader([str(path)]).load()
+
+    log_config = benchmark.pedantic(load, rounds=10)
+    assert len(log_config.loggers) == 500
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_reload(benchmark, config_files, incremental):
+    """ Reload an unchanged config: a full dictConfig reopens every handler. """
+    loader = LoggerLoader(config_files)
+    loader.load(incremental=False)
+    benchmark(loader.load, incremental=incremental)
@@ -0,0 +1,98 @@
+import copy
+import pytest
+from mozi.config import Config
+from mozi.utils import (
+    HMACSigner, canonical_hash, deep_merge, deep_update, freeze, get_config, hmac_sha256, now,
+    sort_list
+)
+from .conftest import make_config
+
+
+def test_get_config(benchmark, config_files):
+    config = benchmark(get_config, config_files)
+    assert len(config['logging']['loggers']) == 200
+
+
+def test_get_config_key(benchmark, config_files):
+    config = benchmark(get_config, config_files, 'logging')
+    assert len(config['loggers']) == 200
+
+
+def test_config_section(benchmark, config_files):
+    # read the files once, parse only the `logging` section
+    section = benchmark(lambda: Config(config_files, env_prefix=None).section('logging'))
+    assert len(section['loggers']) == 200
+
+
+def test_config_section_cached(benchmark, config_files):
+    config = Config(config_files, env_prefix=None)
+    benchmark(config.section, 'logging')
+
+
+def test_deep_update(benchmark):
+    base, overlay = make_config(loggers=2000, depth=50), make_config(loggers=2000, depth=50)
+    benchmark.pedantic(
+        deep_update,
+        setup=lambda: ((copy.deepcopy(base), overlay), {}),
+        rounds=50,
+    )
+
+
+def test_deep_merge(benchmark):
+    # no copy of the inputs needed, they are left unchanged
+    base, overlay = make_config(loggers=2000, depth=50), make_config(loggers=2000, depth=50)
+    benchmark(deep_merge, base, overlay)
+
+
+def test_deepcopy_config(benchmark):
+    # what `LoggerLoader.load` paid on every call before the config was frozen
+    config = make_config(loggers=2000, depth=50)
+    benchmark(copy.deepcopy, config)
+
+
+def test_freeze(benchmark):
+    benchmark(freeze, make_config(loggers=2000, depth=50))
+
+
+def test_now(benchmark):
+    benchmark(now)
+
+
+SECRET = 'webhook-secret'
+MESSAGES = [f'{{"event":"order.paid","id":{i},"ts":1716540253587}}' for i in range(1000)]
+LARGE_MESSAGES = ['x' * 64 * 1024 + str(i) for i in range(100)]
+
+
+def test_hmac_sha256(benchmark):
+    benchmark(lambda: [hmac_sha256(SECRET, m) for m in MESSAGES])
+
+
+def test_signer_sign(benchmark):
+    # the keyed state is computed once, instead of re-keying per message
+    signer = HMACSigner(SECRET)
+    benchmark(lambda: [signer.sign(m) for m in MESSAGES])
+
+
+def test_signer_sign_many(benchmark):
+    benchmark(HMACSigner(SECRET).sign_many, MESSAGES)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_signer_sign_many_large(benchmark, workers):
+    benchmark(HMACSigner(SECRET).sign_many, LARGE_MESSAGES, workers=workers)
+
+
+def payload() -> dict:
+    return {
+        'items': [{'id': i, 'tags': [f't{j}' for j in range(10, 0, -1)], 'scores': [[3, 1], [2]]}
+                  for i in range(1000, 0, -1)],
+        'mixed': [None, 'b', 2, True, 1.5, 'a'] * 100,
+    }
+
+
+def test_sort_list(benchmark):
+    benchmark.pedantic(sort_list, setup=lambda: ((payload(),), {}), rounds=20)
+
+
+def test_canonical_hash(benchmark):
+    benchmark.pedantic(canonical_hash, setup=lambda: ((payload(),), {}), rounds=20)
@@ -1,13 +1,30 @@
+from contextlib import ExitStack
 import time
 from typing import Callable
 from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
 
-from .api_logger import api_log
-from .errors import APIError
+from mozi.tracing import MAX_REQUEST_ID_LENGTH, REQUEST_ID_HEADER, trace
+from .api_logger import api_log, log_extra
+from .cache import CacheBackend, CachedResponse, CacheRoute, MemoryCache, cache_route
+from .errors import VALIDATION_ERROR_CODE, APIError, truncate, validation_detail, validation_key
+from .loader import Loaders, ModelLoader, loader_dependency
+from .profiling import ProfileConfig, profiler
+from .responses import FastJSONResponse
+from .session import SessionDependency, commit_sessions
+from .streaming import CSVResponse, ExportResponse, JSONArrayResponse, NDJSONResponse
 
 
 class LogRequestRoute(APIRoute):
+    """
+    Writes the access log of every request and handles it in a tracing context, see
+    `mozi.tracing`. The request id is taken from the `X-Request-ID` header or generated,
+    logged as `rid` and returned in the same header. Sessions of `SessionDependency`
+    are committed before the response is logged and sent. Requests may be profiled,
+    see `mozi.api.profiling`.
+    """
+
     def get_route_handler(self) -> Callable:
         original_route_handler = super().get_route_handler()
 
@@ -15,16 +32,44 @@ class LogRequestRoute(APIRoute):
             start_time = time.time()
 
             try:
-                response = await original_route_handler(request)
+                if profiler.config is None:
+                    response = await original_route_handler(request)
+                else:
+                    response = await profiler.handle(request, original_route_handler)
+                await commit_sessions(request)
+                if isinstance(response, ExportResponse):
+                    # logged once the body is streamed
+                    response.start_time = start_time
+                    return response
                 await api_log(request, status_code=response.status_code, start_time=start_time)
                 return response
             except APIError as exc:
                 await api_log(request, status_code=exc.status_code,
                               start_time=start_time, payload=exc.dict())
                 raise
+            except RequestValidationError as exc:
+                payload = {
+                    "error_code": getattr(exc, 'error_code', VALIDATION_ERROR_CODE),
+                    "detail": validation_detail(validation_key(exc.errors())),
+                }
+                await api_log(request, status_code=422, start_time=start_time, payload=payload)
+                raise
             except Exception as exc:
                 await api_log(request, status_code=500, start_time=start_time,
-                              payload={"detail": str(exc)})
+                              payload={"detail": truncate(str(exc))})
                 raise
 
-        return custom_route_handler
+        async def traced_route_handler(request: Request) -> Response:
+            request_id = request.headers.get(REQUEST_ID_HEADER, '')[:MAX_REQUEST_ID_LENGTH]
+            with ExitStack() as stack:
+                root = stack.enter_context(
+                    trace(f"{request.method} {self.path}", request_id=request_id))
+                log_extra(request, rid=root.trace.request_id)
+                response = await custom_route_handler(request)
+                response.headers.setdefault(REQUEST_ID_HEADER, root.trace.request_id)
+                if isinstance(response, ExportResponse):
+                    # the trace ends once the body is streamed
+                    response.trace_scope = stack.pop_all()
+                return response
+
+        return traced_route_handler
@@ -1,9 +1,11 @@
 import json
+import logging
 import time
-from typing import Optional
+from typing import Dict, Optional
 
 from fastapi import Request
-from mozi.logger import get_logger
+from mozi.logger import LazyJSON, get_logger, pre_filter
+from mozi.tracing import REQUEST_ID_HEADER
 from mozi.utils import APP_NAME
 
 logger = get_logger(f"{APP_NAME}_api")
@@ -46,24 +48,59 @@ class APILogger:
         if self.payload:
             log_info.update(self.payload)
 
+        extra = getattr(self.request.state, 'api_log', None)
+        if extra:
+            log_info.update({k: v() if callable(v) else v for k, v in extra.items()})
+
         return log_info
 
 
+def log_extra(request: Request, **kwargs) -> None:
+    """
+    Attach extra fields to the access log record of the current request.
+    A callable value is evaluated when the record is written.
+    """
+    extra = getattr(request.state, 'api_log', None)
+    if extra is None:
+        extra = request.state.api_log = {}
+    extra.update(kwargs)
+
+
+def request_id_headers(request: Request) -> Dict[str, str]:
+    """
+    The `X-Request-ID` header of a request handled by `LogRequestRoute`, for
+    responses built outside the route, e.g. by the exception handlers.
+    """
+    rid = getattr(request.state, 'api_log', {}).get('rid')
+    return {REQUEST_ID_HEADER: rid} if rid else {}
+
+
 async def api_log(
     request: Request,
     status_code: int = 200,
     start_time: Optional[float] = None,
     payload: Optional[dict] = None
 ) -> None:
+    level = logging.INFO if is_http_success(status_code) else logging.ERROR
+    if not logger.isEnabledFor(level):
+        # Nothing would be written, skip reading the body and building the record.
+        return
+
     if payload is None:
         payload = {}
     payload["c"] = status_code
     if start_time:
         payload["t"] = round((time.time() - start_time) * 1000, 2)  # ms
 
+    # Sampling and rate limiting only need these, decide before the body is read.
+    if not pre_filter(logger, {"u": request.url.path, "c": status_code, "t": payload.get("t", 0)}):
+        return
+
     log = APILogger(request=request, payload=payload)
     log_info = await log.dict()
-    if is_http_success(status_code):
-        logger.info(json.dumps(log_info))
+    # `api` lets filters such as `mozi.logger.SamplingFilter` inspect the record,
+    # the message is only serialised if a handler formats it.
+    if level == logging.INFO:
+        logger.info(LazyJSON(log_info), extra={'api': log_info, 'prefiltered': True})
     else:
-        logger.error(json.dumps(log_info))
+        logger.error(LazyJSON(log_info), extra={'api': log_info, 'prefiltered': True})
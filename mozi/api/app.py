@@ -1,31 +1,162 @@
 # pylint: disable=W0613
-from fastapi import FastAPI, Request, status
+from contextlib import asynccontextmanager
+import os
+from typing import Callable, List, Optional, Union
+from fastapi import FastAPI, Request, Response
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import Engine, text
 
-from mozi.api.errors import APIError
-from mozi.utils import is_debug
+from mozi.api.api_logger import logger, request_id_headers
+from mozi.api.errors import (
+    VALIDATION_ERROR_CODE, APIError, error_body, truncate, validation_body, validation_key
+)
+from mozi.api.profiling import ProfileConfig, profiler
+from mozi.api.responses import FastJSONResponse
+from mozi.config import Config
+from mozi.logger import DEFAULT_LOG_DIR, LoggerLoader
+from mozi.tracing import FileSpanExporter, set_exporter
+from mozi.utils import APP_NAME, FilePath, is_debug
 
-app = FastAPI(debug=is_debug())
 
-
-@app.exception_handler(APIError)
-async def api_error_handler(request: Request, exc: APIError) -> JSONResponse:
-    return JSONResponse(content=exc.dict(), status_code=exc.status_code)
+async def api_error_handler(request: Request, exc: APIError) -> Response:
+    return Response(
+        content=error_body(exc.error_code, exc.detail),
+        status_code=exc.status_code,
+        headers={**request_id_headers(request), **(exc.headers or {})},
+        media_type='application/json',
+    )
 
 
-@app.exception_handler(Exception)
 async def custom_error_handler(request: Request, exc: Exception) -> PlainTextResponse:
-    return PlainTextResponse(f"Internal Server Error: {str(exc)}", status_code=500)
+    logger.error("Unhandled exception: %s %s", request.method, request.url.path, exc_info=exc)
+    return PlainTextResponse(truncate(f"Internal Server Error: {exc}"), status_code=500,
+                             headers=request_id_headers(request))
+
+
+async def validation_error_handler(request: Request, exc: RequestValidationError) -> Response:
+    error_code = getattr(exc, 'error_code', VALIDATION_ERROR_CODE)
+    return Response(
+        content=validation_body(error_code, validation_key(exc.errors())),
+        status_code=422,
+        headers=request_id_headers(request),
+        media_type='application/json',
+    )
+
+
+def warm_up(engine: Engine, size: int):
+    """ Open `size` pool connections up front so the first requests do not pay for connecting. """
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def load_logging(config: Config) -> str:
+    """ Load the `logging` section if any, returns the log directory of the api logger. """
+    log_dir = DEFAULT_LOG_DIR
+    if config.section('logging'):
+        for item in LoggerLoader(config).load().loggers:
+            if item.name == logger.name:
+                log_dir = os.path.dirname(item.log_file)
+    return log_dir
+
+
+def create_app(
+    config: Optional[Union[Config, List[FilePath]]] = None,
+    engine: Optional[Engine] = None,
+    lifespan: Optional[Callable] = None,
+) -> FastAPI:
+    """
+    Build the FastAPI app from the `api` section of the config (a `Config` or yml files):
 
+        api:
+          debug: false
+          docs: false            # disable /docs, /redoc and /openapi.json
+          title: my-service
+          gzip_minimum_size: 1024
+          pool_warm_up: 5        # connections opened on startup, default: pool size
+          trace_file: /var/log/my-service/traces.jsonl   # export request traces (OTLP/JSON)
+          profile:               # see `ProfileConfig`, off without this section
+            token: secret        # profile requests with `X-Profile: secret`
+            rate: 0.001          # and a sample of the others
 
-@app.exception_handler(RequestValidationError)
-async def validation_error_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
-    msg = "Invalid "
-    for error in exc.errors():
-        msg += f" {'.'.join(error['loc'])}: {error['msg']};"
+    On startup the `logging` section is loaded by `LoggerLoader` and the engine's
+    pool is warmed up; on shutdown the engine is disposed. `lifespan` is an extra
+    async context manager factory run inside, e.g. to warm caches. Profiles are written
+    to `path`, by default a `profiles` directory next to the log file of the api logger.
+    """
+    if not isinstance(config, Config):
+        config = Config(config or [])
+    api_config = config.section('api')
+    profile_config = api_config.get('profile')
 
-    return JSONResponse(
-        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-        content={'error_code': 102, 'detail': msg},
+    @asynccontextmanager
+    async def app_lifespan(application: FastAPI):
+        log_dir = load_logging(config)
+        if profile_config is not None:
+            profiler.configure(ProfileConfig(**{'path': f'{log_dir}/profiles', **profile_config}))
+        trace_file = api_config.get('trace_file')
+        if trace_file:
+            set_exporter(FileSpanExporter(trace_file, api_config.get('title', APP_NAME)))
+        if engine is not None:
+            size = getattr(engine.pool, 'size', lambda: 1)()
+            warm_up(engine, api_config.get('pool_warm_up', size))
+
+        try:
+            if lifespan is None:
+                yield
+            else:
+                async with lifespan(application) as state:
+                    yield state
+        finally:
+            if trace_file:
+                set_exporter(None)
+            if profile_config is not None:
+                profiler.configure(None)
+            if engine is not None:
+                engine.dispose()
+
+    docs = api_config.get('docs', True)
+    application = FastAPI(
+        debug=api_config.get('debug', is_debug()),
+        title=api_config.get('title', APP_NAME),
+        docs_url='/docs' if docs else None,
+        redoc_url='/redoc' if docs else None,
+        openapi_url='/openapi.json' if docs else None,
+        default_response_class=FastJSONResponse,
+        lifespan=app_lifespan,
     )
+
+    application.add_exception_handler(APIError, api_error_handler)  # type: ignore
+    application.add_exception_handler(Exception, custom_error_handler)
+    application.add_exception_handler(RequestValidationError, validation_error_handler)  # type: ignore
+
+    if api_config.get('gzip_minimum_size'):
+        application.add_middleware(GZipMiddleware, minimum_size=api_config['gzip_minimum_size'])
+    return application
+
+
+_app: Optional[FastAPI] = None  # pylint: disable=invalid-name
+app: FastAPI  # built by `get_app()` on first access, see `__getattr__`
+
+
+def get_app() -> FastAPI:
+    """ The application of the project, created once. """
+    global _app  # pylint: disable=global-statement
+    if _app is None:
+        _app = create_app()
+    return _app
+
+
+def __getattr__(name: str):
+    # `app` is built on first access, so importing this module stays cheap.
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,226 @@
+from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import time
+from urllib.parse import quote
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from mozi.tracing import REQUEST_ID_HEADER
+from .api_logger import log_extra
+
+CACHE_METHODS = {'GET', 'HEAD'}
+# Not replayed on a hit: recomputed for every response, or specific to the request.
+UNCACHED_HEADERS = frozenset({'content-length', 'date', 'etag', REQUEST_ID_HEADER.lower()})
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    status_code: int = field(default=200)
+    media_type: Optional[str] = field(default=None)
+    etag: str = field(default='')
+    headers: List[Tuple[str, str]] = field(default_factory=list)  # set by the endpoint
+
+    def __post_init__(self):
+        if not self.etag:
+            self.etag = f'"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+
+    def to_response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code,
+                            headers={'ETag': self.etag})
+        response.raw_headers.extend(
+            (k.encode('latin-1'), v.encode('latin-1')) for k, v in self.headers
+        )
+        if self.media_type and 'content-type' not in response.headers:
+            response.headers['content-type'] = self.media_type
+        return response
+
+
+class CacheBackend(ABC):
+    """ Storage of serialised responses. Subclass to plug in e.g. a shared cache. """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: CachedResponse, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+
+class MemoryCache(CacheBackend):
+    """ In-process LRU cache with per-entry TTL. """
+
+    def __init__(self, max_size: int = 1024):
+        if max_size <= 0:
+            raise ValueError(f'Invalid max_size: {max_size}')
+
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: CachedResponse, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+
+class CacheRoute(APIRoute):
+    """
+    Caches serialised GET responses keyed by path, query string and the `vary`
+    headers. Concurrent misses on one key run the endpoint once (single-flight),
+    and `If-None-Match` is answered with 304 when the ETag still matches.
+    The endpoint's headers are replayed on a hit; responses setting cookies or
+    marked `Cache-Control: private` / `no-store` are not cached.
+    Configure it through `cache_route()`.
+    """
+    ttl: float = 60
+    vary: Sequence[str] = ()
+    backend: CacheBackend = MemoryCache()
+
+    def cache_key(self, request: Request) -> str:
+        # Sorted by name only: the order of repeated parameters, e.g. `ids`, matters.
+        pairs = sorted(request.url.query.split('&'), key=lambda p: p.split('=', 1)[0])
+        headers = '&'.join(f'{h}={quote(request.headers.get(h, ""), safe="")}'
+                           for h in self.vary)
+        return f'{request.url.path}?{"&".join(pairs)}#{headers}'
+
+    @staticmethod
+    def cacheable(response: Response) -> bool:
+        if response.status_code != 200 or not hasattr(response, 'body'):
+            # error status or streaming body
+            return False
+        if 'set-cookie' in response.headers:
+            return False
+        cache_control = response.headers.get('cache-control', '').lower()
+        return 'private' not in cache_control and 'no-store' not in cache_control
+
+    async def store(self, key: str, response: Response) -> Optional[CachedResponse]:
+        if not self.cacheable(response):
+            return None
+
+        cached = CachedResponse(
+            body=bytes(response.body),
+            status_code=response.status_code,
+            media_type=response.media_type,
+            headers=[(k, v) for k, v in response.headers.items() if k not in UNCACHED_HEADERS],
+        )
+        await self.backend.set(key, cached, self.ttl)
+        return cached
+
+    @staticmethod
+    def respond(request: Request, cached: CachedResponse) -> Response:
+        if request.headers.get('if-none-match') == cached.etag:
+            return Response(status_code=304, headers={'ETag': cached.etag})
+        return cached.to_response()
+
+    @staticmethod
+    async def wait_inflight(inflight: Dict[str, asyncio.Future],
+                            key: str) -> Optional[CachedResponse]:
+        """ Share the result of another request computing `key`, if any. """
+        cached = None
+        while cached is None and key in inflight:
+            shared = inflight[key]
+            try:
+                cached = await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise  # this request was cancelled
+                # the other request was cancelled, compute the key here
+        return cached
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+        inflight: Dict[str, asyncio.Future] = {}
+        stats = {'hit': 0, 'miss': 0}
+
+        async def custom_route_handler(request: Request) -> Response:
+            if request.method not in CACHE_METHODS:
+                return await original_route_handler(request)
+
+            key = self.cache_key(request)
+            cached = await self.backend.get(key) or await self.wait_inflight(inflight, key)
+
+            if cached is not None:
+                stats['hit'] += 1
+                log_extra(request, ca='hit', ch=stats['hit'], cm=stats['miss'])
+                return self.respond(request, cached)
+
+            stats['miss'] += 1
+            log_extra(request, ca='miss', ch=stats['hit'], cm=stats['miss'])
+
+            future = asyncio.get_running_loop().create_future()
+            inflight[key] = future
+            try:
+                response = await original_route_handler(request)
+                cached = await self.store(key, response)
+                future.set_result(cached)
+            except Exception as exc:
+                future.set_exception(exc)
+                future.exception()  # retrieved, even when nobody else waits on it
+                raise
+            finally:
+                if not future.done():
+                    # cancelled, e.g. the client disconnected: waiters compute it themselves
+                    future.cancel()
+                if inflight.get(key) is future:
+                    del inflight[key]
+
+            if cached is None:
+                return response
+            if request.headers.get('if-none-match') == cached.etag:
+                return Response(status_code=304, headers={'ETag': cached.etag})
+            response.headers['ETag'] = cached.etag
+            return response
+
+        return custom_route_handler
+
+
+def cache_route(
+    ttl: float = 60,
+    vary: Sequence[str] = (),
+    backend: Optional[CacheBackend] = None,
+    max_size: int = 1024,
+    route_class: Type[APIRoute] = APIRoute,
+) -> Type[APIRoute]:
+    """
+    Build a route class caching GET responses, e.g. with access logging:
+
+        router = APIRouter(route_class=cache_route(ttl=30, route_class=LogRequestRoute))
+
+    `route_class` wraps the cache, so a cache hit is still logged by `LogRequestRoute`.
+    """
+    attrs = {
+        'ttl': ttl,
+        'vary': tuple(h.lower() for h in vary),
+        'backend': backend or MemoryCache(max_size=max_size),
+    }
+    bases = (CacheRoute,) if route_class is APIRoute else (route_class, CacheRoute)
+    return type('CacheRoute', bases, attrs)
@@ -1,7 +1,12 @@
-from typing import Optional
+import functools
+import json
+from typing import Any, Optional, Sequence
 from fastapi import HTTPException
 from fastapi.exceptions import RequestValidationError
 
+VALIDATION_ERROR_CODE = 102
+MAX_DETAIL_LENGTH = 1024
+
 
 class GenericError(Exception):
     error_code = 20
@@ -29,3 +34,39 @@ class APIError(HTTPException):
 class NotFoundError(APIError):
     error_code = 101
     status_code = 404
+
+
+def truncate(detail: str, limit: int = MAX_DETAIL_LENGTH) -> str:
+    if len(detail) <= limit:
+        return detail
+    return f'{detail[:limit - 3]}...'
+
+
+@functools.lru_cache(maxsize=None)
+def _error_prefix(error_code: int) -> bytes:
+    """ Pre-serialised head of the error body of an error code. """
+    return f'{{"error_code":{error_code},"detail":'.encode()
+
+
+def error_body(error_code: int, detail: Any) -> bytes:
+    """ JSON body `{"error_code": ..., "detail": ...}` with a bounded string detail. """
+    if isinstance(detail, str):
+        detail = truncate(detail)
+    content = json.dumps(detail, ensure_ascii=False, separators=(',', ':'))
+    return b''.join((_error_prefix(error_code), content.encode(), b'}'))
+
+
+def validation_key(errors: Sequence[dict]) -> tuple:
+    """ Hashable summary of validation errors, identical failures share the same key. """
+    return tuple((tuple(error['loc']), error['msg']) for error in errors)
+
+
+@functools.lru_cache(maxsize=1024)
+def validation_detail(key: tuple) -> str:
+    msg = ''.join(f" {'.'.join(map(str, loc))}: {error};" for loc, error in key)
+    return truncate(f'Invalid {msg}')
+
+
+@functools.lru_cache(maxsize=1024)
+def validation_body(error_code: int, key: tuple) -> bytes:
+    return error_body(error_code, validation_detail(key))
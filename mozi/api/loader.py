@@ -0,0 +1,130 @@
+# pylint: disable=redefined-builtin
+import asyncio
+from typing import Any, Callable, Dict, Generic, List, Optional, Set, Type
+
+from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
+
+from mozi.db import T
+from .session import is_async_session
+
+
+class ModelLoader(Generic[T]):
+    """
+    Collects `get_by_id` calls issued in the same event-loop tick and resolves them
+    with a single `gets_by_ids` call (chunked by the dialect's parameter limit).
+    Results are memoised for the lifetime of the loader (one request).
+
+    The query runs off the event loop: in the threadpool for a `Session`, through
+    `run_sync` for an `AsyncSession`. Loaders sharing a session must share `lock`
+    (see `Loaders`), so their batches do not use the session at the same time.
+    """
+
+    def __init__(self, model: Type[T], session: Any, lock: Optional[asyncio.Lock] = None):
+        self.model = model
+        self.session = session
+        self.lock = lock or asyncio.Lock()
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._queue: List[int] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, id: int) -> 'asyncio.Future[Optional[T]]':
+        future = self._futures.get(id)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[id] = future
+
+        if not self._queue:
+            # Dispatch once every coroutine scheduled in this tick has queued its id.
+            loop.call_soon(self._dispatch)
+        self._queue.append(id)
+        return future
+
+    async def load_many(self, ids: List[int]) -> List[Optional[T]]:
+        """ Load records in caller order, `None` for missing ids. """
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    def clear(self, id: Optional[int] = None):
+        """ Forget memoised results, e.g. after the record was updated. """
+        if id is None:
+            self._futures = {k: f for k, f in self._futures.items() if not f.done()}
+        elif id in self._futures and self._futures[id].done():
+            del self._futures[id]
+
+    def _dispatch(self):
+        ids, self._queue = self._queue, []
+        # keep a reference, the loop only holds a weak one
+        task = asyncio.get_running_loop().create_task(self._resolve(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, ids: List[int]) -> List[Optional[T]]:
+        gets_by_ids = self.model.gets_by_ids  # type: ignore
+        async with self.lock:
+            if is_async_session(self.session):
+                return await self.session.run_sync(gets_by_ids, ids, ordered=True)
+            return await run_in_threadpool(gets_by_ids, self.session, ids, ordered=True)
+
+    async def _resolve(self, ids: List[int]):
+        try:
+            records = await self._fetch(ids)
+        except asyncio.CancelledError:
+            self._fail(ids, None)
+            raise
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._fail(ids, exc)
+            return
+
+        for id, record in zip(ids, records):
+            future = self._futures[id]
+            if not future.done():
+                future.set_result(record)
+
+    def _fail(self, ids: List[int], exc: Optional[Exception]):
+        """ Forget the ids, so a later load retries them, and fail (or cancel) their futures. """
+        for id in ids:
+            future = self._futures.pop(id)
+            if future.done():
+                continue
+            if exc is None:
+                future.cancel()
+            else:
+                future.set_exception(exc)
+
+
+class Loaders:
+    """
+    Request-scoped registry of `ModelLoader` instances, one per model, sharing the
+    session and its lock.
+    """
+
+    def __init__(self, session: Any):
+        self.session = session
+        self.lock = asyncio.Lock()
+        self._loaders: Dict[type, ModelLoader] = {}
+
+    def __getitem__(self, model: Type[T]) -> ModelLoader[T]:
+        if model not in self._loaders:
+            self._loaders[model] = ModelLoader(model, self.session, self.lock)
+        return self._loaders[model]
+
+
+def loader_dependency(get_session: Callable) -> Callable:
+    """
+    Build a FastAPI dependency returning `Loaders` bound to the session provided by
+    `get_session`. FastAPI caches dependencies per request, so every handler and
+    sub-dependency of one request shares the same loaders.
+
+        get_loaders = loader_dependency(get_session)
+
+        @app.get("/users/{id}")
+        async def read_user(id: int, loaders: Loaders = Depends(get_loaders)):
+            return await loaders[User].load(id)
+    """
+    def dependency(session: Any = Depends(get_session)) -> Loaders:
+        return Loaders(session)
+
+    return dependency
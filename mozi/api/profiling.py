@@ -0,0 +1,94 @@
+import cProfile
+from dataclasses import dataclass, field
+import hmac
+import os
+import random
+import re
+import threading
+from typing import Awaitable, Callable, Optional
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from mozi.ids import ulid
+from mozi.logger import DEFAULT_LOG_DIR
+from mozi.tracing import request_id
+from mozi.utils import FilePath, ensure_dir
+from .api_logger import log_extra
+
+PROFILE_HEADER = 'X-Profile'
+
+
+@dataclass
+class ProfileConfig:
+    header: str = field(default=PROFILE_HEADER)
+    token: Optional[str] = field(default=None)  # required header value, any value if None
+    rate: float = field(default=0.0)  # fraction of requests profiled without the header
+    path: FilePath = field(default=f'{DEFAULT_LOG_DIR}/profiles')
+
+    def __post_init__(self):
+        if not 0 <= self.rate <= 1:
+            raise ValueError(f"Profile rate must be between 0 and 1: {self.rate}")
+
+
+class RequestProfiler:
+    """
+    Runs requests under cProfile, when asked by the header or picked by the sampling
+    rate, and writes the stats to `<path>/<request id>.prof` (read them with `pstats`
+    or snakeviz); the file is logged as `pf`. The profiler sees every thread of the
+    process, so concurrent requests show up in the profile too, and only one request
+    is profiled at a time: others run as usual. Unconfigured, it costs the route
+    handler one attribute check.
+    """
+
+    def __init__(self):
+        self.config: Optional[ProfileConfig] = None
+        self._lock = threading.Lock()
+
+    def configure(self, config: Optional[ProfileConfig]):
+        """ Enable profiling with `config`, None disables it. """
+        if config is not None:
+            ensure_dir(config.path)
+        self.config = config
+
+    def wanted(self, request: Request) -> bool:
+        config = self.config
+        if config is None:
+            return False
+
+        value = request.headers.get(config.header)
+        if value:
+            return config.token is None or hmac.compare_digest(value, config.token)
+        return random.random() < config.rate
+
+    async def handle(self, request: Request,
+                     call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+        config = self.config
+        if config is None or not self.wanted(request) or not self._lock.acquire(blocking=False):  # pylint: disable=consider-using-with  # noqa: E501
+            return await call_next(request)
+
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler or debugger holds the profiling hook
+                return await call_next(request)
+
+            try:
+                return await call_next(request)
+            finally:
+                profile.disable()
+                filename = os.path.join(config.path, f'{profile_name()}.prof')
+                await run_in_threadpool(profile.dump_stats, filename)
+                log_extra(request, pf=filename)
+        finally:
+            self._lock.release()
+
+
+def profile_name() -> str:
+    # The request id may come from a client header, keep it a plain file name.
+    name = re.sub(r'[^A-Za-z0-9_-]', '_', request_id() or '')
+    return name or ulid()
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,65 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+import functools
+import json
+from typing import Any
+from uuid import UUID
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+@functools.lru_cache(maxsize=256)
+def _list_adapter(model: type) -> TypeAdapter:
+    return TypeAdapter(list[model])  # type: ignore
+
+
+def _default(obj: Any) -> Any:
+    """ Types neither orjson nor json handle natively. """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json')
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialise content to JSON bytes. SQLModel/pydantic instances, and lists of a
+    single model type, are written by pydantic's serializer without building dicts.
+    Other content uses orjson when installed, falling back to the stdlib `json`.
+    """
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+
+    if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+        model = type(content[0])
+        if all(type(item) is model for item in content):  # pylint: disable=unidiomatic-typecheck
+            return _list_adapter(model).dump_json(content)
+
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)  # pylint: disable=no-member
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response backed by `dumps`. FastAPI runs `jsonable_encoder` on endpoint
+    results before rendering, so return the response directly to skip it:
+
+        @app.get("/users")
+        def users(session: Session = Depends(get_session)):
+            return FastJSONResponse(User.all(session))
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
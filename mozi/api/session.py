@@ -0,0 +1,129 @@
+from contextlib import asynccontextmanager
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Union
+from fastapi import Request
+from sqlalchemy import Engine
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+try:
+    # needs greenlet, see the `api` extra
+    from sqlalchemy.ext.asyncio import AsyncEngine  # pylint: disable=ungrouped-imports
+    from sqlmodel.ext.asyncio.session import AsyncSession  # pylint: disable=ungrouped-imports
+except ImportError:  # pragma: no cover
+    AsyncEngine = AsyncSession = None  # type: ignore
+
+from mozi.db import QueryStats, query_stats, track_queries
+from .api_logger import log_extra
+
+
+def is_async_engine(engine: Any) -> bool:
+    return AsyncEngine is not None and isinstance(engine, AsyncEngine)
+
+
+def is_async_session(session: Any) -> bool:
+    return AsyncSession is not None and isinstance(session, AsyncSession)
+
+
+async def timed_commit(commit: Callable[[], Awaitable[None]], stats: Optional[QueryStats]):
+    """
+    Run `commit` and count it as one query in `stats`. The statements it flushes are
+    tracked one by one, the COMMIT itself is not, so its whole duration replaces theirs.
+    """
+    if stats is None:
+        await commit()
+        return
+
+    token = query_stats.set(stats)
+    duration, start = stats.duration, time.perf_counter()
+    try:
+        await commit()
+    finally:
+        stats.count += 1
+        stats.duration = duration + time.perf_counter() - start
+        query_stats.reset(token)
+
+
+def commit_on_response(request: Request, commit: Callable[[], Awaitable[None]]):
+    """ Register a commit to be run by `commit_sessions` before the response is sent. """
+    commits = getattr(request.state, 'db_commits', None)
+    if commits is None:
+        commits = request.state.db_commits = []
+    commits.append(commit)
+
+
+async def commit_sessions(request: Request):
+    """ Commit the sessions handed out to the request, called by `LogRequestRoute`. """
+    commits = getattr(request.state, 'db_commits', None)
+    while commits:
+        await commits.pop(0)()
+
+
+class SessionDependency:
+    """
+    Request-scoped database session. A session checks out a pool connection only
+    on its first query, so handlers that never touch the database never connect.
+    Query count (dq) and time (dt, ms) of the request, commit included, are added to
+    the api_log record.
+
+        get_session = SessionDependency(engine)
+
+        @app.get("/users/{id}")
+        def read_user(id: int, session: Session = Depends(get_session)):
+            return User.get_by_id(session, id)
+
+    With `LogRequestRoute` the transaction is committed when the handler returns,
+    before the response is sent and logged, so a failing commit goes on to the app's
+    exception handlers like any other error. When the handler raises it is rolled back.
+    Other route classes need `Depends(get_session, scope="function")` to commit before
+    the response is sent, FastAPI otherwise tears the dependency down afterwards.
+
+    An `AsyncEngine` yields an `AsyncSession` instead.
+    """
+
+    def __init__(self, engine: Union[Engine, 'AsyncEngine'], **kwargs):
+        self.engine = engine
+        self.kwargs = kwargs
+        track_queries(engine.sync_engine if is_async_engine(engine) else engine)  # type: ignore
+
+    async def commit(self, session: Union[Session, 'AsyncSession'],
+                     stats: Optional[QueryStats] = None):
+        if not session.in_transaction():
+            return
+        stats = stats or query_stats.get()
+        if is_async_engine(self.engine):
+            await timed_commit(session.commit, stats)  # type: ignore
+        else:
+            await timed_commit(lambda: run_in_threadpool(session.commit), stats)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Union[Session, 'AsyncSession']]:
+        if is_async_engine(self.engine):
+            async with AsyncSession(self.engine, **self.kwargs) as async_session:
+                try:
+                    yield async_session
+                    await self.commit(async_session)
+                except Exception:
+                    await async_session.rollback()
+                    raise
+            return
+
+        session = Session(self.engine, **self.kwargs)
+        try:
+            yield session
+            await self.commit(session)
+        except Exception:
+            await run_in_threadpool(session.rollback)
+            raise
+        finally:
+            await run_in_threadpool(session.close)
+
+    async def __call__(self, request: Request) -> AsyncIterator[Union[Session, 'AsyncSession']]:
+        stats = QueryStats()
+        query_stats.set(stats)
+        log_extra(request, dq=lambda: stats.count, dt=lambda: round(stats.duration * 1000, 2))
+
+        async with self.session() as session:
+            # run from the route, where `query_stats` set above is not visible
+            commit_on_response(request, lambda: self.commit(session, stats))
+            yield session
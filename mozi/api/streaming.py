@@ -0,0 +1,144 @@
+from abc import ABC, abstractmethod
+from contextlib import ExitStack
+import csv
+import io
+import time
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.types import Receive, Scope, Send
+
+from mozi.tracing import span
+from .api_logger import api_log
+from .errors import truncate
+from .responses import dumps
+
+
+class ExportResponse(StreamingResponse, ABC):
+    """
+    Streams chunks of records and writes the access log once the body is sent,
+    with the number of rows (sr) and bytes (sb). A sync chunk iterator runs in the
+    threadpool and is only advanced after the previous chunk was sent, so a slow
+    client holds back the database instead of piling chunks up in memory.
+    `LogRequestRoute` leaves the logging of this response to it, and hands over its
+    trace (`trace_scope`), which ends once the body is sent; the body is streamed in
+    an `export` span.
+    """
+
+    def __init__(self, request: Request, chunks: Iterable[Sequence[Any]], media_type: str,
+                 headers: Optional[dict] = None):
+        self.request = request
+        self.rows = 0
+        self.size = 0
+        self.start_time = time.time()
+        self.trace_scope = ExitStack()
+        super().__init__(self.encode_chunks(chunks), media_type=media_type, headers=headers)
+
+    @abstractmethod
+    def encode(self, chunk: Sequence[Any]) -> bytes:
+        """ The bytes of a chunk of records. """
+
+    def prologue(self) -> bytes:
+        return b''
+
+    def epilogue(self) -> bytes:
+        return b''
+
+    def encode_chunks(self, chunks: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+        yield from self._counted(self.prologue())
+        for chunk in chunks:
+            if chunk:
+                data = self.encode(chunk)
+                self.rows += len(chunk)
+                yield from self._counted(data)
+        yield from self._counted(self.epilogue())
+
+    def _counted(self, data: bytes) -> Iterator[bytes]:
+        if data:
+            self.size += len(data)
+            yield data
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        with self.trace_scope:
+            # The log reads the request body, which cannot be received once the response is sent.
+            await self.request.body()
+            try:
+                with span('export') as export:
+                    try:
+                        await super().__call__(scope, receive, send)
+                    finally:
+                        if export is not None:
+                            export.set_attribute('export.rows', self.rows)
+                            export.set_attribute('export.bytes', self.size)
+            except Exception as exc:
+                await api_log(self.request, status_code=500, start_time=self.start_time,
+                              payload={"sr": self.rows, "sb": self.size,
+                                       "detail": truncate(str(exc))})
+                raise
+            await api_log(self.request, status_code=self.status_code, start_time=self.start_time,
+                          payload={"sr": self.rows, "sb": self.size})
+
+
+class NDJSONResponse(ExportResponse):
+    """ One JSON document per line. """
+
+    def __init__(self, request: Request, chunks: Iterable[Sequence[Any]],
+                 headers: Optional[dict] = None):
+        super().__init__(request, chunks, media_type='application/x-ndjson', headers=headers)
+
+    def encode(self, chunk: Sequence[Any]) -> bytes:
+        return b''.join([dumps(row) + b'\n' for row in chunk])
+
+
+class JSONArrayResponse(ExportResponse):
+    """ A single JSON array written incrementally, one chunk at a time. """
+
+    def __init__(self, request: Request, chunks: Iterable[Sequence[Any]],
+                 headers: Optional[dict] = None):
+        self._first = True
+        super().__init__(request, chunks, media_type='application/json', headers=headers)
+
+    def prologue(self) -> bytes:
+        return b'['
+
+    def epilogue(self) -> bytes:
+        return b']'
+
+    def encode(self, chunk: Sequence[Any]) -> bytes:
+        # dumps() serialises a list of one model type in a single pass, strip its brackets.
+        data = dumps(list(chunk))[1:-1]
+        if self._first:
+            self._first = False
+            return data
+        return b',' + data
+
+
+class CSVResponse(ExportResponse):
+    """ CSV with a header row. `fields` defaults to the fields of the first row. """
+
+    def __init__(self, request: Request, chunks: Iterable[Sequence[Any]],
+                 fields: Optional[List[str]] = None, filename: Optional[str] = None,
+                 headers: Optional[dict] = None):
+        self.fields = fields
+        headers = dict(headers or {})
+        if filename:
+            headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        super().__init__(request, chunks, media_type='text/csv; charset=utf-8', headers=headers)
+
+    def encode(self, chunk: Sequence[Any]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self.fields is None:
+            first = chunk[0]
+            self.fields = list(type(first).model_fields if isinstance(first, BaseModel) else first)
+            writer.writerow(self.fields)
+        elif not self.rows:
+            writer.writerow(self.fields)
+
+        for row in chunk:
+            if isinstance(row, dict):
+                writer.writerow([row.get(f) for f in self.fields])
+            else:
+                writer.writerow([getattr(row, f) for f in self.fields])
+        return buffer.getvalue().encode('utf-8')
@@ -0,0 +1,138 @@
+import functools
+import os
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+import yaml
+
+from .utils import APP_NAME, FilePath, deep_merge, freeze
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader  # type: ignore
+
+ENV_PREFIX = f"{APP_NAME.upper()}_"
+ENV_SEPARATOR = '__'
+EMPTY: Mapping = MappingProxyType({})
+
+
+def _construct(node: yaml.Node) -> Any:
+    return SafeLoader('').construct_document(node)  # type: ignore
+
+
+def _parse_env(value: str) -> Any:
+    try:
+        return yaml.load(value, Loader=SafeLoader)
+    except yaml.YAMLError:
+        return value
+
+
+class Config:
+    """
+    Layered config of yml files plus environment variables, read once.
+
+    The files are composed into YAML nodes up front, but a section is only turned
+    into Python objects, merged over the layers and frozen on its first access:
+
+        config = Config(['base.yml', 'prod.yml'])
+        logging_config = config.section('logging')
+        rotate = config.section('rotate', RotateConfig)   # RotateConfig(**section)
+
+    Environment variables `<env_prefix><SECTION>__<KEY>__<SUBKEY>=<yaml value>`
+    override the files, e.g. `MOZI_LOGGING__LOG_PATH=/var/log/app`.
+    `env_prefix=None` disables the overlay.
+    """
+
+    def __init__(self, yml_files: List[FilePath], env_prefix: Optional[str] = ENV_PREFIX,
+                 environ: Optional[Mapping[str, str]] = None):
+        self.yml_files = list(yml_files)
+        self.env_prefix = env_prefix
+        self._lock = threading.Lock()
+        self._sections: Dict[str, Any] = {}
+        self._typed: Dict[Tuple[str, Callable], Any] = {}
+
+        # section -> yaml node per file, in file order
+        self._nodes: Dict[str, List[yaml.Node]] = {}
+        for path in self.yml_files:
+            with open(path, 'r', encoding='utf-8') as config_file:
+                root = yaml.compose(config_file, Loader=SafeLoader)
+            if root is None:
+                continue
+            if not isinstance(root, yaml.MappingNode):
+                raise ValueError(f"Config file is not a mapping: {path}")
+            for key_node, value_node in root.value:
+                self._nodes.setdefault(_construct(key_node), []).append(value_node)
+
+        self._env: Dict[str, Any] = {}
+        if env_prefix is not None:
+            self._env = self._env_overlay(os.environ if environ is None else environ)
+
+    def _env_overlay(self, environ: Mapping[str, str]) -> Dict[str, Any]:
+        overlay: Dict[str, Any] = {}
+        for name, value in environ.items():
+            if not name.startswith(self.env_prefix) or name == self.env_prefix:  # type: ignore
+                continue
+
+            *path, last = name[len(self.env_prefix):].lower().split(ENV_SEPARATOR)  # type: ignore
+            node = overlay
+            for key in path:
+                child = node.get(key)
+                if not isinstance(child, dict):
+                    child = node[key] = {}
+                node = child
+            if not isinstance(node.get(last), dict):
+                node[last] = _parse_env(value)
+        return overlay
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._nodes or key in self._env
+
+    def keys(self) -> List[str]:
+        return list(dict.fromkeys([*self._nodes, *self._env]))
+
+    def section(self, key: str, cls: Optional[Callable] = None) -> Any:
+        """
+        Merged, read-only section, an empty mapping if it does not exist.
+        With `cls`, the section is passed as keyword arguments and the instance cached.
+        """
+        if key not in self._sections:
+            with self._lock:
+                if key not in self._sections:
+                    self._sections[key] = self._load(key)
+        value = self._sections[key]
+        if cls is None:
+            return value
+
+        typed_key = (key, cls)
+        if typed_key not in self._typed:
+            with self._lock:
+                if typed_key not in self._typed:
+                    self._typed[typed_key] = cls(**value)
+        return self._typed[typed_key]
+
+    def _load(self, key: str) -> Any:
+        layers = [_construct(node) for node in self._nodes.get(key, [])]
+        if key in self._env:
+            layers.append(self._env[key])
+        layers = [layer for layer in layers if layer is not None]
+
+        if not layers:
+            return EMPTY
+        if all(isinstance(layer, Mapping) for layer in layers):
+            return deep_merge(*layers, frozen=True)
+        return freeze(layers[-1])
+
+    def to_dict(self) -> dict:
+        """ Every section, parsed. """
+        return {key: self.section(key) for key in self.keys()}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_config(yml_files: Tuple[FilePath, ...], env_prefix: Optional[str]) -> Config:
+    return Config(list(yml_files), env_prefix=env_prefix)
+
+
+def load_config(yml_files: List[FilePath], env_prefix: Optional[str] = ENV_PREFIX) -> Config:
+    """ The process-wide `Config` of these files, built on the first call. """
+    return _load_config(tuple(yml_files), env_prefix)
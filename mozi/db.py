@@ -1,16 +1,41 @@
 # pylint: disable=redefined-builtin
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Callable, Generic, List, Optional, TypeVar, Union
-from sqlalchemy import Engine
-from sqlmodel import SQLModel, Field, Session, func, select
+import functools
+import os
+import time
+import unittest
+from typing import (
+    Any, Callable, Generic, Iterator, List, Literal, Optional, Sequence, TypeVar, Union, overload
+)
+from sqlalchemy import (
+    Column, Engine, Index, MetaData, Table, delete, event, insert, literal, text
+)
+from sqlalchemy.orm import declared_attr
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Field, Session, create_engine, func, select
 from sqlmodel.sql.expression import Select, SelectOfScalar
 
 from .logger import get_logger
+from .tracing import current_span, record_query
 from .utils import now
 
 Statement = Union[Select, SelectOfScalar]
 logger = get_logger('sqlalchemy.engine')
 
+# Maximum bound parameters a single statement may carry, by dialect name.
+DIALECT_MAX_PARAMS = {
+    'sqlite': 999,
+    'mssql': 2100,
+    'oracle': 1000,
+    'postgresql': 32767,
+    'mysql': 65535,
+}
+DEFAULT_MAX_PARAMS = 999
+
 
 def create_db_and_tables(engine: Engine):
     """Create database and tables"""
@@ -22,6 +47,65 @@ def drop_db_and_tables(engine: Engine):
     SQLModel.metadata.drop_all(engine)
 
 
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0  # seconds
+
+    def add(self, duration: float):
+        self.count += 1
+        self.duration += duration
+
+
+# Statistics of the queries issued by the current request (or any other unit of work).
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments,too-many-positional-arguments  # noqa: E501
+    if query_stats.get() is not None or current_span() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments,too-many-positional-arguments  # noqa: E501
+    if not conn.info.get('query_start'):
+        return
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    stats = query_stats.get()
+    if stats is not None:
+        stats.add(duration)
+    record_query(duration)
+
+
+def track_queries(engine: Engine) -> Engine:
+    """
+    Record count and duration of every query into `query_stats` when it is set,
+    and into the current tracing span.
+    """
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    return engine
+
+
+class VersionConflictError(Exception):
+    """ The record was modified by another transaction since it was loaded. """
+
+
+def max_params(session: Session) -> int:
+    """ Maximum number of bound parameters the session's dialect accepts per statement. """
+    dialect = session.get_bind().dialect.name
+    return DIALECT_MAX_PARAMS.get(dialect, DEFAULT_MAX_PARAMS)
+
+
+def chunks(items: Sequence, size: int) -> Iterator[list]:
+    """ Split items into lists of at most `size` elements. """
+    if size <= 0:
+        raise ValueError(f'Invalid chunk size: {size}')
+
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
+
+
 class BaseTable(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: Optional[datetime] = Field(default_factory=now)
@@ -43,8 +127,83 @@ class BaseTable(SQLModel):
         return super().__setattr__(name, value)
 
 
+def live_index(name: str, *columns: str, **kwargs) -> Index:
+    """
+    Partial index over the rows that are not soft deleted, for the columns a
+    `SoftDeleteModel` is filtered by (a plain index on dialects without partial indexes):
+
+        __table_args__ = (
+            soft_delete_index('orders'),
+            live_index('ix_orders_user_id_live', 'user_id', 'created_at'),
+        )
+    """
+    where = text('deleted_at IS NULL')
+    return Index(name, *columns, sqlite_where=where, postgresql_where=where, **kwargs)
+
+
+def soft_delete_index(table_name: str) -> Index:
+    """ (deleted_at, id): serves `deleted_at IS NULL` filters and the `archive` scan. """
+    return Index(f'ix_{table_name}_deleted_at_id', 'deleted_at', 'id')
+
+
+class VersionedTable(BaseTable):
+    """
+    Optimistic concurrency: every UPDATE/DELETE is issued as
+    `... WHERE id = ? AND version = ?` and bumps `version`. When no row matches,
+    another transaction won the race and `VersionConflictError` is raised.
+    """
+    version: int = Field(default=1, nullable=False)
+
+    @declared_attr  # type: ignore
+    def __mapper_args__(cls) -> dict:  # pylint: disable=no-self-argument
+        return {'version_id_col': cls.__table__.c.version}  # type: ignore
+
+
+class SoftDeleteTable(BaseTable):
+    """
+    Soft delete: `delete()` sets `deleted_at` and the rows are left out of the
+    queries of `DBMixin` unless `with_deleted=True` is passed. Rows deleted long enough
+    ago can be moved to an archive table with `SoftDeleteModel.archive`.
+    A model defining its own `__table_args__` should include `soft_delete_index`.
+    """
+    __soft_delete__ = True
+
+    deleted_at: Optional[datetime] = Field(default=None)
+
+    @declared_attr  # type: ignore
+    def __table_args__(cls) -> tuple:  # pylint: disable=no-self-argument
+        return (soft_delete_index(cls.__tablename__),)  # type: ignore
+
+
 # Uses TypeVar and Generic to ensure type safety
 T = TypeVar('T', bound=BaseTable)
+R = TypeVar('R')
+
+
+def retry_on_conflict(retries: int = 3, backoff: float = 0.0) -> Callable:
+    """
+    Retry the decorated function when it raises `VersionConflictError`.
+    The function must re-read the records it modifies on every call.
+
+        @retry_on_conflict(retries=5)
+        def incr(session, id):
+            counter = Counter.get_by_id(session, id)
+            return counter.update(session, value=counter.value + 1)
+    """
+    def decorator(function: Callable[..., R]) -> Callable[..., R]:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> R:
+            for attempt in range(retries):
+                try:
+                    return function(*args, **kwargs)
+                except VersionConflictError:
+                    if attempt == retries - 1:
+                        raise
+                    if backoff:
+                        time.sleep(backoff * (2 ** attempt))
+            raise ValueError(f'Invalid retries: {retries}')
+        return wrapper
+    return decorator
 
 
 class DBMixin(Generic[T]):
@@ -52,6 +211,8 @@ class DBMixin(Generic[T]):
     A mixin class that provides common database operations for SQLModel models.
     Generic type T must be a SQLModel subclass.
     """
+    __soft_delete__ = False
+
     @classmethod
     def checkf(cls, field) -> bool:
         if not hasattr(cls, field):
@@ -65,6 +226,9 @@ class DBMixin(Generic[T]):
             session.commit()
             session.refresh(self)
             return self  # type: ignore
+        except StaleDataError as exc:
+            session.rollback()
+            raise VersionConflictError(str(exc)) from exc
         except Exception:
             session.rollback()
             raise
@@ -73,6 +237,9 @@ class DBMixin(Generic[T]):
         try:
             session.delete(self)
             session.commit()
+        except StaleDataError as exc:
+            session.rollback()
+            raise VersionConflictError(str(exc)) from exc
         except Exception:
             session.rollback()
             raise
@@ -82,11 +249,18 @@ class DBMixin(Generic[T]):
         result = list(session.exec(statement).all())
         return result or []
 
+    @classmethod
+    def _exclude_deleted(cls, statement: Statement, with_deleted: bool = False) -> Statement:
+        if cls.__soft_delete__ and not with_deleted:
+            statement = statement.where(cls.deleted_at.is_(None))  # type: ignore
+        return statement
+
     @classmethod
     def _filter_by(
         cls,
         only_count: bool = False,
         filter_factory: Optional[Callable] = None,
+        with_deleted: bool = False,
         **kwargs
     ) -> Statement:
         """Filter records by given criteria."""
@@ -94,6 +268,7 @@ class DBMixin(Generic[T]):
             statement = select(func.count(cls.id))  # pylint: disable=not-callable  # type: ignore
         else:
             statement = select(cls)
+        statement = cls._exclude_deleted(statement, with_deleted)
 
         for key, value in kwargs.items():
             if hasattr(cls, key):
@@ -118,9 +293,12 @@ class DBMixin(Generic[T]):
         return cls(**kwargs)._upsert(session)
 
     @classmethod
-    def get_by_id(cls, session: Session, id: int) -> Optional[T]:
+    def get_by_id(cls, session: Session, id: int, with_deleted: bool = False) -> Optional[T]:
         """Get a record by its ID."""
-        return session.get(cls, id)  # type: ignore
+        record = session.get(cls, id)
+        if record is not None and cls.__soft_delete__ and not with_deleted:
+            return None if record.deleted_at is not None else record  # type: ignore
+        return record  # type: ignore
 
     @classmethod
     def get_for_update(cls, session: Session, id: int) -> Optional[T]:
@@ -144,12 +322,71 @@ class DBMixin(Generic[T]):
         return result[0] if result else None
 
     @classmethod
-    def gets_by_ids(cls, session: Session, ids: List[int]) -> List[T]:
+    def _gets_chunk(cls, bind: Engine, ids: List[int], with_deleted: bool = False) -> List[T]:
+        """ Load one chunk of ids on its own connection, detached from the session. """
+        with Session(bind) as session:
+            statement = select(cls).where(cls.id.in_(ids))  # type: ignore
+            statement = cls._exclude_deleted(statement, with_deleted)
+            result = cls._all(session, statement)
+            session.expunge_all()
+            return result
+
+    @overload
+    @classmethod
+    def gets_by_ids(cls, session: Session, ids: List[int], ordered: Literal[False] = False,
+                    workers: int = 1, with_deleted: bool = False) -> List[T]:
+        ...
+
+    @overload
+    @classmethod
+    def gets_by_ids(cls, session: Session, ids: List[int], ordered: Literal[True],
+                    workers: int = 1, with_deleted: bool = False) -> List[Optional[T]]:
+        ...
+
+    @classmethod
+    def gets_by_ids(
+        cls,
+        session: Session,
+        ids: List[int],
+        ordered: bool = False,
+        workers: int = 1,
+        with_deleted: bool = False,
+    ) -> Union[List[T], List[Optional[T]]]:
+        """
+        Get records by ids. The IN-list is split into chunks that fit the dialect's
+        bound-parameter limit.
+
+        ordered: return one item per given id in the given order (duplicates kept),
+                 `None` for ids that do not exist.
+        workers: run chunks concurrently, each on its own connection from the engine.
+                 Only used when the session is bound to an Engine (otherwise the chunks
+                 run one after another on the session's connection), and the workers
+                 only see committed rows, not the session's pending changes.
+        with_deleted: include soft deleted records.
+        """
         if not ids:
             return []
 
-        statement = select(cls).where(cls.id.in_(ids))  # type: ignore
-        return cls._all(session, statement)
+        id_chunks = list(chunks(list(dict.fromkeys(ids)), max_params(session)))
+        bind = session.get_bind()
+        if workers > 1 and len(id_chunks) > 1 and isinstance(bind, Engine):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(
+                    lambda chunk: cls._gets_chunk(bind, chunk, with_deleted), id_chunks
+                ))
+            result = [session.merge(r, load=False) for part in parts for r in part]
+        else:
+            result = []
+            for chunk in id_chunks:
+                statement = select(cls).where(cls.id.in_(chunk))  # type: ignore
+                statement = cls._exclude_deleted(statement, with_deleted)
+                result.extend(cls._all(session, statement))
+
+        if not ordered:
+            return result  # type: ignore
+
+        records = {r.id: r for r in result}
+        return [records.get(id) for id in ids]
 
     @classmethod
     def all(
@@ -169,6 +406,36 @@ class DBMixin(Generic[T]):
 
         return cls._all(session, statement)
 
+    @classmethod
+    def iter_chunks(
+        cls,
+        session: Session,
+        chunk_size: int = 1000,
+        filter_factory: Optional[Callable] = None,
+        **kwargs
+    ) -> Iterator[List[T]]:
+        """
+        Iterate all matching records in id order, `chunk_size` records at a time.
+        Each chunk is a separate keyset query (`id > last id`), so no cursor or
+        long-running query stays open between chunks.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f'Invalid chunk_size: {chunk_size}')
+
+        last_id = None
+        while True:
+            statement = cls._filter_by(filter_factory=filter_factory, **kwargs)
+            if last_id is not None:
+                statement = statement.where(cls.id > last_id)  # type: ignore
+            statement = statement.order_by(cls.id).limit(chunk_size)  # type: ignore
+
+            result = cls._all(session, statement)
+            if result:
+                yield result
+            if len(result) < chunk_size:
+                return
+            last_id = result[-1].id  # type: ignore
+
     @classmethod
     def count(cls, session: Session, filter_factory: Optional[Callable] = None, **kwargs) -> int:
         statement = cls._filter_by(only_count=True, filter_factory=filter_factory, **kwargs)
@@ -200,3 +467,174 @@ class DBMixin(Generic[T]):
 
 class BaseModel(BaseTable, DBMixin):
     pass
+
+
+class VersionedModel(VersionedTable, DBMixin):
+    pass
+
+
+# Archive tables are kept out of `SQLModel.metadata`, so `create_all`/`drop_all` leave them alone.
+archive_metadata = MetaData()
+
+
+class SoftDeleteModel(SoftDeleteTable, DBMixin):
+
+    def delete(self, session: Session):
+        """ Mark the record deleted, see `hard_delete` to remove it. """
+        self.deleted_at = now()
+        return self._upsert(session)
+
+    def restore(self, session: Session) -> T:
+        self.deleted_at = None
+        return self._upsert(session)
+
+    def hard_delete(self, session: Session):
+        return self._delete(session)
+
+    @classmethod
+    def archive_table(cls) -> Table:
+        """
+        `<table>_archive`: the columns of the table, without its indexes and
+        constraints, and `archived_at`. Created by the first `archive` if missing,
+        in `archive_metadata`, not in `SQLModel.metadata`.
+        """
+        table = cls.__table__  # type: ignore
+        name = f'{table.name}_archive'
+        key = f'{table.schema}.{name}' if table.schema else name
+        if key not in archive_metadata.tables:
+            columns = [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False)
+                       for c in table.columns]
+            columns.append(Column('archived_at', table.c.deleted_at.type, nullable=False))
+            Table(name, archive_metadata, *columns, schema=table.schema)
+        return archive_metadata.tables[key]
+
+    @classmethod
+    def archive(cls, session: Session, before: datetime, chunk_size: int = 1000) -> int:
+        """
+        Move the records soft deleted before `before` to `archive_table()`, `chunk_size`
+        records per transaction, so the table is never locked for long. Returns the
+        number of records moved. Chunks already committed stay archived when a later
+        one fails.
+
+        The chunks run in a session of their own on the bind of `session`, which is
+        left as it is: its uncommitted changes are not archived (and may block the
+        archive on SQLite), commit them first. On a session bound to a Connection,
+        e.g. `TestDatabase`, every chunk is a savepoint of the connection's transaction.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f'Invalid chunk_size: {chunk_size}')
+
+        with Session(session.get_bind(), join_transaction_mode='create_savepoint') as own:
+            return cls._archive(own, before, chunk_size)
+
+    @classmethod
+    def _archive(cls, session: Session, before: datetime, chunk_size: int) -> int:
+        table, archive = cls.__table__, cls.archive_table()  # type: ignore
+        archive.create(session.connection(), checkfirst=True)
+        session.commit()
+        chunk_size = min(chunk_size, max_params(session))
+
+        moved = 0
+        while True:
+            # (deleted_at, id) order walks `soft_delete_index`, archived rows drop out
+            statement = (
+                select(cls.id)
+                .where(cls.deleted_at < before)  # type: ignore
+                .order_by(cls.deleted_at, cls.id)  # type: ignore
+                .limit(chunk_size)
+            )
+            ids = list(session.exec(statement).all())
+            if not ids:
+                return moved
+
+            try:
+                rows = select(*table.columns, literal(now()).label('archived_at'))
+                session.execute(insert(archive).from_select(
+                    [*table.columns.keys(), 'archived_at'], rows.where(table.c.id.in_(ids))
+                ))
+                session.execute(delete(table).where(table.c.id.in_(ids)))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            moved += len(ids)
+
+
+def _sqlite_savepoints(engine: Engine):
+    """ pysqlite emits its own BEGIN/COMMIT, which breaks SAVEPOINT; let SQLAlchemy do it. """
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+
+class TestDatabase:
+    """
+    A database for tests whose schema is created once per process.
+    `session()` runs inside an outer transaction that `rollback()` discards, and
+    `session.commit()` only releases a savepoint, so no test pays for DDL again.
+
+    `url` defaults to an in-memory SQLite database. A `{worker}` placeholder is
+    replaced by the pytest-xdist worker id, giving every parallel worker its own
+    database, e.g. `sqlite:////dev/shm/app-test-{worker}.db` for tmpfs.
+    """
+    __test__ = False
+
+    def __init__(self, url: str = 'sqlite://', **kwargs):
+        self.url = url.format(worker=os.environ.get('PYTEST_XDIST_WORKER', 'main'))
+        self.kwargs = kwargs
+        self._engine: Optional[Engine] = None
+        self._tables = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            kwargs = dict(self.kwargs)
+            if self.url.startswith('sqlite'):
+                kwargs.setdefault('connect_args', {'check_same_thread': False})
+                if self.url in ('sqlite://', 'sqlite:///:memory:'):
+                    kwargs.setdefault('poolclass', StaticPool)
+            self._engine = create_engine(self.url, **kwargs)
+            if self._engine.dialect.name == 'sqlite':
+                _sqlite_savepoints(self._engine)
+
+        # Models imported after the first test still get their tables.
+        if self._tables != len(SQLModel.metadata.tables):
+            create_db_and_tables(self._engine)
+            self._tables = len(SQLModel.metadata.tables)
+        return self._engine
+
+    def session(self) -> Session:
+        connection = self.engine.connect()
+        connection.begin()
+        return Session(bind=connection, join_transaction_mode='create_savepoint')
+
+    @staticmethod
+    def rollback(session: Session):
+        connection = session.bind
+        session.close()
+        connection.rollback()  # type: ignore
+        connection.close()  # type: ignore
+
+    def dispose(self):
+        if self._engine is not None:
+            drop_db_and_tables(self._engine)
+            self._engine.dispose()
+            self._engine = None
+            self._tables = 0
+
+
+class RollbackTestCase(unittest.TestCase):
+    """ Every test gets `self.session`, rolled back when the test finishes. """
+    database = TestDatabase()
+
+    def setUp(self):
+        self.session = self.database.session()
+        return super().setUp()
+
+    def tearDown(self):
+        self.database.rollback(self.session)
+        return super().tearDown()
@@ -0,0 +1,263 @@
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore  # not on Windows
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from .utils import FilePath
+
+COMPRESS_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def compress_file(source: FilePath, dest: FilePath, method: str):
+    """ Compress source into dest and remove source. """
+    with open(source, 'rb') as fin:
+        if method == 'gzip':
+            with gzip.open(dest, 'wb') as fout:
+                shutil.copyfileobj(fin, fout)
+        else:
+            with open(dest, 'wb') as fout:
+                zstandard.ZstdCompressor().copy_stream(fin, fout)  # type: ignore
+    os.remove(source)
+
+
+def enforce_total_size(base_filename: FilePath, max_total_bytes: int):
+    """
+    Remove the oldest rotated segments of base_filename until they fit in max_total_bytes.
+    The `.lock` file of `MultiProcessRotatingFileHandler` is not a segment.
+    """
+    dirname, basename = os.path.split(base_filename)
+    segments = []
+    for entry in os.scandir(dirname or '.'):
+        if entry.name == f'{basename}.lock':
+            continue
+        if entry.is_file() and entry.name.startswith(f'{basename}.'):
+            stat = entry.stat()
+            segments.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in segments)
+    for _, size, path in sorted(segments):
+        if total <= max_total_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+class BackgroundWorker:
+    """ A single daemon thread running jobs off the logging thread. """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, job: Callable[[], None]):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+
+    def join(self):
+        """ Block until every submitted job is done. """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logging.getLogger(__name__).exception('Log rotation job failed')
+            finally:
+                self._queue.task_done()
+
+
+worker = BackgroundWorker()
+atexit.register(worker.join)
+
+
+class CompressMixin:
+    """
+    Compresses rotated segments (gzip or zstd) in the background worker and caps
+    the total size of all rotated segments, so the logging thread only renames files.
+    """
+    baseFilename: str
+
+    def setup_rotation(self, compress: Optional[str] = None, max_total_bytes: Optional[int] = None):
+        if compress and compress not in COMPRESS_SUFFIXES:
+            raise ValueError(f'Unknown compression: {compress}')
+        if compress == 'zstd' and zstandard is None:
+            raise ValueError('zstd compression requires the `zstandard` package')
+
+        self.compress = compress
+        self.max_total_bytes = max_total_bytes
+        self._done = threading.Event()
+        self._done.set()
+        if compress:
+            self.namer = self._namer
+        if compress or max_total_bytes:
+            self.rotator = self._rotator
+
+    def _rotated_away(self) -> bool:
+        """ The open file is no longer `baseFilename`, e.g. another process renamed it. """
+        try:
+            latest = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        current = os.fstat(self.fd)  # type: ignore
+        return (latest.st_dev, latest.st_ino) != (current.st_dev, current.st_ino)
+
+    def doRollover(self):  # pylint: disable=invalid-name
+        # Only blocks when the previous segment is still being compressed,
+        # otherwise shifting the segment names would race with it.
+        self._done.wait()
+        super().doRollover()  # type: ignore  # pylint: disable=no-member
+
+    def _namer(self, name: str) -> str:
+        return f'{name}{COMPRESS_SUFFIXES[self.compress]}'  # type: ignore
+
+    def _rotator(self, source: FilePath, dest: FilePath):
+        if not self.compress:
+            os.rename(source, dest)
+            self.submit_retention()
+            return
+
+        self._done.clear()
+        pending = dest[:-len(COMPRESS_SUFFIXES[self.compress])]
+        os.rename(source, pending)
+
+        def job():
+            try:
+                compress_file(pending, dest, self.compress)  # type: ignore
+                if self.max_total_bytes:
+                    enforce_total_size(self.baseFilename, self.max_total_bytes)
+            finally:
+                self._done.set()
+
+        worker.submit(job)
+
+    def submit_retention(self):
+        if self.max_total_bytes:
+            base_filename, max_total_bytes = self.baseFilename, self.max_total_bytes
+            worker.submit(lambda: enforce_total_size(base_filename, max_total_bytes))
+
+
+class CompressedRotatingFileHandler(CompressMixin, logging.handlers.RotatingFileHandler):
+    """ `RotatingFileHandler` with background compression and a total size cap. """
+
+    def __init__(self, filename: FilePath, compress: Optional[str] = None,
+                 maxTotalBytes: Optional[int] = None, **kwargs):  # pylint: disable=invalid-name
+        super().__init__(filename, **kwargs)
+        self.setup_rotation(compress, maxTotalBytes)
+
+
+class CompressedTimedRotatingFileHandler(CompressMixin, logging.handlers.TimedRotatingFileHandler):
+    """ `TimedRotatingFileHandler` with background compression and a total size cap. """
+
+    def __init__(self, filename: FilePath, compress: Optional[str] = None,
+                 maxTotalBytes: Optional[int] = None, **kwargs):  # pylint: disable=invalid-name
+        super().__init__(filename, **kwargs)
+        self.setup_rotation(compress, maxTotalBytes)
+
+
+class MultiProcessRotatingFileHandler(logging.Handler):
+    """
+    Size-based rotation that is safe with several processes writing one file, e.g.
+    uvicorn/gunicorn workers. Every record is appended with a single `O_APPEND`
+    write, rotation is serialised by an flock on `<filename>.lock`, and a process
+    reopens the file once another one rotated it away. POSIX only (needs `fcntl`),
+    without compression, time-based rotation or a total size cap.
+    """
+    terminator = '\n'
+
+    def __init__(self, filename: FilePath, maxBytes: int = 0, backupCount: int = 0,  # pylint: disable=invalid-name
+                 encoding: str = 'utf-8'):
+        if fcntl is None:  # pragma: no cover
+            raise ValueError('MultiProcessRotatingFileHandler requires fcntl, POSIX only')
+        super().__init__()
+        self.baseFilename = os.path.abspath(filename)  # pylint: disable=invalid-name
+        self.lockFilename = f'{self.baseFilename}.lock'  # pylint: disable=invalid-name
+        self.maxBytes = maxBytes  # pylint: disable=invalid-name
+        self.backupCount = backupCount  # pylint: disable=invalid-name
+        self.encoding = encoding
+        self.fd: Optional[int] = None
+        self._open()
+
+    def _open(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = os.open(self.baseFilename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            data = f'{self.format(record)}{self.terminator}'.encode(self.encoding)
+            if self._rotated_away():
+                self._open()
+            stat = os.fstat(self.fd)  # type: ignore
+            if self.maxBytes and stat.st_size + len(data) > self.maxBytes:
+                self.doRollover()
+            os.write(self.fd, data)  # type: ignore
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handleError(record)
+
+    def _rotated_away(self) -> bool:
+        """ The open file is no longer `baseFilename`, e.g. another process renamed it. """
+        try:
+            latest = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        current = os.fstat(self.fd)  # type: ignore
+        return (latest.st_dev, latest.st_ino) != (current.st_dev, current.st_ino)
+
+    def doRollover(self):  # pylint: disable=invalid-name
+        with open(self.lockFilename, 'a', encoding='utf-8') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current = os.fstat(self.fd)  # type: ignore
+                try:
+                    latest = os.stat(self.baseFilename)
+                except FileNotFoundError:
+                    latest = None
+
+                # Rotate only if no other process did it since we checked the size.
+                if latest is not None and latest.st_ino == current.st_ino:
+                    self._shift()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._open()
+
+    def _shift(self):
+        if self.backupCount <= 0:
+            os.truncate(self.baseFilename, 0)
+            return
+
+        for i in range(self.backupCount - 1, 0, -1):
+            source = f'{self.baseFilename}.{i}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.baseFilename}.{i + 1}')
+        os.replace(self.baseFilename, f'{self.baseFilename}.1')
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+        finally:
+            self.release()
+            super().close()
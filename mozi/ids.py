@@ -0,0 +1,113 @@
+import base64
+from datetime import datetime, timezone
+import functools
+import hashlib
+import os
+import threading
+import time
+from typing import Iterable, List
+
+# Crockford's base32, as used by ULID: sortable and without I, L, O, U.
+ENCODING = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+DECODING = {c: i for i, c in enumerate(ENCODING)}
+_PAIRS = [a + b for a in ENCODING for b in ENCODING]
+ULID_LENGTH = 26
+RANDOM_BITS = 80
+_SHIFTS = range(ULID_LENGTH * 5 - 10, -1, -10)
+
+
+def _encoded_size(length: int) -> int:
+    # Every 3 digest bytes map to exactly 4 base64 chars, so encoding only the
+    # bytes needed for `length` chars gives the same prefix as the full digest.
+    return min(-(-length // 4) * 3, hashlib.sha256().digest_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def short_hash(message: str, length: int = 8) -> str:
+    """ Deterministic url-safe id of `message`: the base64-encoded SHA-256, cut to `length`. """
+    digest = hashlib.sha256(message.encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest[:_encoded_size(length)]).decode("utf-8")[:length]
+
+
+def uuids(messages: Iterable[str], length: int = 8) -> List[str]:
+    """
+    `short_hash` of each message, in order. Bulk inputs are mostly distinct, so
+    this skips the memo instead of churning it.
+    """
+    size = _encoded_size(length)
+    sha256, encode_b64 = hashlib.sha256, base64.urlsafe_b64encode
+    return [encode_b64(sha256(m.encode("utf-8")).digest()[:size]).decode("utf-8")[:length]
+            for m in messages]
+
+
+class ULIDGenerator:
+    """
+    Time-ordered unique ids: 48 bits of unix time in ms and 80 random bits, in
+    26 chars of Crockford's base32, so ids sort by creation time as strings.
+    Within one millisecond the random part is incremented, so ids of a process are
+    strictly increasing. Other processes draw their own randomness (also after a fork).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def reset(self):
+        # Called in a forked child, where the lock may have been held by another thread.
+        self._lock = threading.Lock()
+        self._last_ms = -1
+
+    def new(self) -> str:
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= self._last_ms:
+                # same millisecond or clock went back, keep counting from the last id
+                ms = self._last_ms
+                rand = self._last_random + 1
+                if rand >> RANDOM_BITS:
+                    # random part overflowed, borrow the next millisecond
+                    ms, rand = ms + 1, int.from_bytes(os.urandom(10), 'big') >> 1
+            else:
+                # top bit clear leaves room to increment within the millisecond
+                rand = int.from_bytes(os.urandom(10), 'big') >> 1
+            self._last_ms, self._last_random = ms, rand
+
+        return encode((ms << RANDOM_BITS) | rand)
+
+
+def encode(value: int) -> str:
+    # 10 bits (two chars) per lookup, 13 lookups cover 130 bits.
+    return ''.join([_PAIRS[(value >> shift) & 1023] for shift in _SHIFTS])
+
+
+def decode(value: str) -> int:
+    if len(value) != ULID_LENGTH:
+        raise ValueError(f'Invalid ULID: {value}')
+
+    result = 0
+    for char in value.upper():
+        if char not in DECODING:
+            raise ValueError(f'Invalid ULID: {value}')
+        result = (result << 5) | DECODING[char]
+    return result
+
+
+_generator = ULIDGenerator()
+if hasattr(os, 'register_at_fork'):
+    # A forked child must not continue the parent's sequence.
+    os.register_at_fork(after_in_child=_generator.reset)
+
+
+def ulid() -> str:
+    """ A new time-ordered unique id, e.g. `01J0Z3K8QW5X9V7B2N4M6P8R0T`. """
+    return _generator.new()
+
+
+def ulids(count: int) -> List[str]:
+    return [_generator.new() for _ in range(count)]
+
+
+def ulid_time(value: str) -> datetime:
+    """ Creation time of a ULID (UTC, ms precision). """
+    return datetime.fromtimestamp((decode(value) >> RANDOM_BITS) / 1000, tz=timezone.utc)
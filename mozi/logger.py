@@ -1,12 +1,17 @@
-import copy
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from enum import Enum
+from fnmatch import fnmatch
+import json
 import logging
 import logging.config
 import os
-from typing import List, Optional, Union
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Union
 
-from .utils import FilePath, Path, ensure_dir, get_config, uuid
+from .config import Config
+from .utils import FilePath, Path, ensure_dir, uuid
 
 # custom logging level type
 Level = int
@@ -22,6 +27,7 @@ class HandlerEnum(Enum):
     ROTATE = 'rotate'
     FILE = 'file'
     ERROR = 'error'
+    MP_ROTATE = 'mp_rotate'  # rotate, safe with several worker processes sharing the file
 
     @classmethod
     def contains(cls, value: Union[str, 'HandlerEnum']) -> bool:
@@ -41,10 +47,179 @@ class Formatter:
 class RotateConfig:
     max_bytes: int = field(default=MAX_FILE_SIZE)
     backup_count: int = field(default=5)
+    compress: Optional[str] = field(default=None)  # gzip | zstd, done in a background thread
+    when: Optional[str] = field(default=None)  # rotate by time instead of size, e.g. midnight, H
+    interval: int = field(default=1)
+    max_total_bytes: Optional[int] = field(default=None)  # cap of all rotated segments
+
+    def to_dict(self) -> dict:
+        """ Handler options, plain `RotatingFileHandler` unless extra options are set. """
+        if self.when:
+            config = {
+                'class': 'mozi.handlers.CompressedTimedRotatingFileHandler',
+                'when': self.when,
+                'interval': self.interval,
+                'backupCount': self.backup_count,
+            }
+        elif self.compress or self.max_total_bytes:
+            config = {
+                'class': 'mozi.handlers.CompressedRotatingFileHandler',
+                'maxBytes': self.max_bytes,
+                'backupCount': self.backup_count,
+            }
+        else:
+            return {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'maxBytes': self.max_bytes,
+                'backupCount': self.backup_count,
+            }
+
+        if self.compress:
+            config['compress'] = self.compress
+        if self.max_total_bytes:
+            config['maxTotalBytes'] = self.max_total_bytes
+        return config
+
+
+@dataclass
+class SamplingRule:
+    """ Keep `rate` (0~1) of the records whose route and status match, e.g. status '2xx'. """
+    rate: float = field(default=1.0)
+    route: str = field(default='*')
+    status: str = field(default='*')
+
+    def __post_init__(self):
+        self.status = str(self.status)
+
+    def match(self, route: str, status: int) -> bool:
+        return fnmatch(route, self.route) and fnmatch(str(status), self.status.replace('x', '?'))
+
+
+@dataclass
+class SamplingConfig:
+    default: float = field(default=1.0)
+    slow_ms: Optional[float] = field(default=None)  # slower records are always kept
+    rules: List[SamplingRule] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.rules = [SamplingRule(**r) if isinstance(r, Mapping) else r for r in self.rules]
+
+
+@dataclass
+class RateLimitConfig:
+    rate: float  # records per second
+    burst: Optional[int] = field(default=None)
+    summary_interval: float = field(default=60)
+
+
+def pre_filter(logger: logging.Logger, info: Mapping) -> bool:
+    """
+    Run the filters of `logger` that decide on the route (`u`), status (`c`) and
+    latency (`t`) of an access log record, before the record is built. A record that
+    passes is logged with `extra={'prefiltered': True}`, so they do not run twice.
+    """
+    return all(f.pre_filter(logger.name, info) for f in logger.filters if hasattr(f, 'pre_filter'))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Samples access log records carrying an `api` dict (see `mozi.api.api_log`)
+    by route (`u`) and status code (`c`). The first matching rule wins.
+    `mozi.api.api_log` samples through `pre_filter`, before it reads the body.
+    """
+
+    def __init__(self, default: float = 1.0, slow_ms: Optional[float] = None, rules: Optional[list] = None):  # pylint: disable=line-too-long
+        super().__init__()
+        self.config = SamplingConfig(default=default, slow_ms=slow_ms, rules=rules or [])
+
+    def rate(self, route: str, status: int) -> float:
+        for rule in self.config.rules:
+            if rule.match(route, status):
+                return rule.rate
+        return self.config.default
+
+    def pre_filter(self, name: str, info: Mapping) -> bool:  # pylint: disable=unused-argument
+        if self.config.slow_ms is not None and info.get('t', 0) >= self.config.slow_ms:
+            return True
+
+        rate = self.rate(info.get('u', ''), info.get('c', 0))
+        return rate >= 1 or random.random() < rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        info = getattr(record, 'api', None)
+        if not info or getattr(record, 'prefiltered', False):
+            return True
+        return self.pre_filter(record.name, info)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket of `rate` records per second (up to `burst` at once). Suppressed
+    records are counted and reported in one summary record per `summary_interval`,
+    by a timer if no later record comes, and by `close()` when the filter is replaced.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None, summary_interval: float = 60):
+        super().__init__()
+        self.config = RateLimitConfig(rate=rate, burst=burst, summary_interval=summary_interval)
+        self.capacity = float(burst or max(rate, 1))
+        self.tokens = self.capacity
+        self.suppressed = 0
+        self.updated_at = self.summary_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._logger_name = ''
+
+    def pre_filter(self, name: str, info: Optional[Mapping] = None) -> bool:  # pylint: disable=unused-argument
+        with self._lock:
+            now = time.monotonic()
+            refill = (now - self.updated_at) * self.config.rate
+            self.tokens = min(self.capacity, self.tokens + refill)
+            self.updated_at = now
+
+            allowed = self.tokens >= 1
+            if allowed:
+                self.tokens -= 1
+            else:
+                self.suppressed += 1
+                self._logger_name = name
+                if self._timer is None:
+                    delay = max(self.summary_at + self.config.summary_interval - now, 0)
+                    self._timer = threading.Timer(delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+            due = now - self.summary_at >= self.config.summary_interval
+        if due and self.suppressed:
+            self.flush()
+        return allowed
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'rate_limit_summary', False) or getattr(record, 'prefiltered', False):
+            return True
+        return self.pre_filter(record.name)
+
+    def flush(self):
+        """ Report the records suppressed since the last summary. """
+        with self._lock:
+            suppressed, self.suppressed = self.suppressed, 0
+            self.summary_at = time.monotonic()
+            timer, self._timer = self._timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+
+        if suppressed:
+            logging.getLogger(self._logger_name).warning(
+                "Rate limit: %s records suppressed in the last %ss",
+                suppressed, self.config.summary_interval, extra={'rate_limit_summary': True},
+            )
+
+    def close(self):
+        self.flush()
 
 
 @dataclass
-class LoggerItem:
+class LoggerItem:  # pylint: disable=too-many-instance-attributes
     name: str
     level: LevelName = field(default='INFO')
     handlers: List[HandlerEnum] = field(default_factory=list)
@@ -52,22 +227,39 @@ class LoggerItem:
     formatter: str = field(default='default')
     log_path: Path = field(default=DEFAULT_LOG_DIR)
     rotate_cnf: RotateConfig = field(default_factory=RotateConfig)
+    sampling: Optional[SamplingConfig] = field(default=None)
+    rate_limit: Optional[RateLimitConfig] = field(default=None)
+    trace: bool = field(default=False)  # add %(request_id)s etc. to records, see mozi.tracing
 
     def __post_init__(self):
         if not self.handlers:
             self.handlers = [HandlerEnum.CONSOLE]
 
+        if isinstance(self.rotate_cnf, Mapping):
+            self.rotate_cnf = RotateConfig(**self.rotate_cnf)
+        if isinstance(self.sampling, Mapping):
+            self.sampling = SamplingConfig(**self.sampling)
+        if isinstance(self.rate_limit, Mapping):
+            self.rate_limit = RateLimitConfig(**self.rate_limit)
+
         # uniq handlers
         handlers = [HandlerEnum(h) for h in self.handlers]
         self.handlers = list(set(handlers))
 
+        rotate = self.rotate_cnf
+        if HandlerEnum.MP_ROTATE in self.handlers and (
+                rotate.compress or rotate.when or rotate.max_total_bytes):
+            raise ValueError(f"{self.name}: mp_rotate does not support compress, when "
+                             "or max_total_bytes")
+
         self.uuid: str = uuid(self.name, length=10)
         self._log_file: Optional[FilePath] = None
         self._error_file: Optional[FilePath] = None
 
     @classmethod
     def load(cls, name: str, config: Optional[dict] = None, log_path: Optional[Path] = None) -> 'LoggerItem':  # pylint: disable=line-too-long
-        config = copy.deepcopy(config) or {}
+        # config may be shared (see `LoggerLoader`), only top-level keys are replaced
+        config = dict(config or {})
 
         handlers = config.get('handlers') or ['console']
         if handlers:
@@ -98,13 +290,14 @@ class LoggerItem:
 
     @property
     def error_file(self) -> FilePath:
-        fname = os.path.basename(self.log_file)
-        fpath = os.path.dirname(self.log_file)
-        fname = fname.replace('.log', '_error.log')
+        if not self._error_file:
+            fpath, fname = os.path.split(self.log_file)
+            fname = fname.replace('.log', '_error.log')
 
-        if fpath:
-            fpath = f"{fpath}/"
-        return f"{fpath}{fname}"
+            if fpath:
+                fpath = f"{fpath}/"
+            self._error_file = f"{fpath}{fname}"
+        return self._error_file
 
     def console(self) -> dict:
         return {
@@ -129,22 +322,30 @@ class LoggerItem:
     def rotate(self) -> dict:
         return {
             f'rotate-{self.uuid}': {
-                'class': 'logging.handlers.RotatingFileHandler',
                 'level': self.level,
                 'formatter': self.formatter,
                 'filename': self.log_file,
-                'maxBytes': self.rotate_cnf.max_bytes,
-                'backupCount': self.rotate_cnf.backup_count,
+                **self.rotate_cnf.to_dict(),
             }
         }
 
     def error(self) -> dict:
         return {
             f'error-{self.uuid}': {
-                'class': 'logging.handlers.RotatingFileHandler',
                 'level': 'ERROR',
                 'formatter': self.formatter,
                 'filename': self.error_file,
+                **self.rotate_cnf.to_dict(),
+            }
+        }
+
+    def mp_rotate(self) -> dict:
+        return {
+            f'mp_rotate-{self.uuid}': {
+                'class': 'mozi.handlers.MultiProcessRotatingFileHandler',
+                'level': self.level,
+                'formatter': self.formatter,
+                'filename': self.log_file,
                 'maxBytes': self.rotate_cnf.max_bytes,
                 'backupCount': self.rotate_cnf.backup_count,
             }
@@ -155,17 +356,45 @@ class LoggerItem:
         for handler in HandlerEnum:
             if handler in self.handlers:
                 handlers.update(getattr(self, handler.value)())
+
+        handler_filters = list(self.get_handler_filters_dict())
+        if handler_filters:
+            for handler_config in handlers.values():
+                handler_config['filters'] = list(handler_filters)
         return handlers
 
-    def to_dict(self) -> dict:
-        return {
-            self.name: {
-                'level': self.level,
-                'handlers': [f"{h.value}-{self.uuid}" for h in self.handlers],
-                'propagate': self.propagate,
+    def get_handler_filters_dict(self) -> dict:
+        """ Filters of the handlers, so they also see records propagated from child loggers. """
+        if self.trace:
+            return {f'trace-{self.uuid}': {'()': 'mozi.tracing.TraceFilter'}}
+        return {}
+
+    def get_filters_dict(self) -> dict:
+        filters = {}
+        if self.sampling:
+            filters[f'sampling-{self.uuid}'] = {
+                '()': 'mozi.logger.SamplingFilter',
+                **asdict(self.sampling),
+            }
+        if self.rate_limit:
+            filters[f'rate_limit-{self.uuid}'] = {
+                '()': 'mozi.logger.RateLimitFilter',
+                **asdict(self.rate_limit),
             }
+        return filters
+
+    def to_dict(self) -> dict:
+        config = {
+            'level': self.level,
+            'handlers': [f"{h.value}-{self.uuid}" for h in self.handlers],
+            'propagate': self.propagate,
         }
 
+        filters = list(self.get_filters_dict())
+        if filters:
+            config['filters'] = filters
+        return {self.name: config}
+
 
 @dataclass
 class LoggerConfig:
@@ -180,10 +409,12 @@ class LoggerConfig:
             raise ValueError("No logger configuration found")
 
     def to_dict(self) -> dict:
-        handlers, loggers = {}, {}
+        handlers, loggers, filters = {}, {}, {}
         for logger in self.loggers:
             handlers.update(logger.get_handlers_dict())
             loggers.update(logger.to_dict())
+            filters.update(logger.get_filters_dict())
+            filters.update(logger.get_handler_filters_dict())
 
         fmts = {}
         for formatter in self.formatters:
@@ -195,18 +426,153 @@ class LoggerConfig:
             'handlers': handlers,
             'loggers': loggers,
         }
+        if filters:
+            config['filters'] = filters
         return config
 
 
+class LiveLogging:
+    """
+    The logging config applied by `LoggerLoader`. The first load is a full
+    `dictConfig`; later loads are diffed against it: handlers and filters whose
+    definition (or formatter) is unchanged are kept as they are, files stay open and
+    buffers are kept, only changed ones are built anew. Each logger's handler list is
+    swapped in one assignment and replaced handlers are flushed and closed after the
+    swap, so no record is dropped. Loggers dropped from the config are disabled, as
+    `dictConfig` does.
+    """
+
+    def __init__(self):
+        self.config: Optional[dict] = None
+        self.handlers: Dict[str, logging.Handler] = {}
+        self.filters: Dict[str, logging.Filter] = {}
+        self._lock = threading.Lock()
+
+    def apply(self, log_config: 'LoggerConfig', incremental: bool = True):
+        config = log_config.to_dict()
+        with self._lock:
+            if self.config is None or not incremental:
+                old_filters = self.filters
+                logging.config.dictConfig(config)
+                self._collect(config)
+                self._close_filters(old_filters)
+            else:
+                self._update(config)
+            self.config = config
+
+    def _collect(self, config: dict):
+        """ Index the objects created by `dictConfig` by their config id. """
+        self.handlers, self.filters = {}, {}
+        for name, logger_config in config['loggers'].items():
+            logger = logging.getLogger(name)
+            for handler in logger.handlers:
+                self.handlers[handler.name] = handler  # type: ignore
+                handler_filters = config['handlers'][handler.name].get('filters', [])  # type: ignore
+                self.filters.update(zip(handler_filters, handler.filters))  # type: ignore
+            self.filters.update(zip(logger_config.get('filters', []), logger.filters))  # type: ignore
+
+    def _update(self, config: dict):
+        old = self.config or {}
+        configurator = logging.config.DictConfigurator({
+            'version': 1,
+            'formatters': config['formatters'],
+            'handlers': config['handlers'],
+            'filters': config.get('filters', {}),
+        })
+        filters = self._diff_filters(old, config, configurator)
+        changed_filters = {k for k, v in filters.items() if self.filters.get(k) is not v}
+        # handlers built below resolve their filters by id
+        configurator.config['filters'].update(filters)
+        handlers = self._diff_handlers(old, config, configurator, changed_filters)
+
+        for name, logger_config in config['loggers'].items():
+            logger = logging.getLogger(name)
+            logger.setLevel(logger_config['level'])
+            logger.propagate = logger_config['propagate']
+            logger.disabled = False
+            logger.filters = [filters[f] for f in logger_config.get('filters', [])]
+            logger.handlers = [handlers[h] for h in logger_config['handlers']]
+
+        for name in old['loggers'].keys() - config['loggers'].keys():
+            logger = logging.getLogger(name)
+            logger.handlers, logger.filters = [], []
+            logger.disabled = True
+
+        for handler_id, handler in self.handlers.items():
+            if handlers.get(handler_id) is not handler:
+                handler.flush()
+                handler.close()
+        old_filters, self.handlers, self.filters = self.filters, handlers, filters
+        self._close_filters(old_filters)
+
+    def _close_filters(self, old_filters: Dict[str, logging.Filter]):
+        """ Let replaced filters report what they hold back, e.g. `RateLimitFilter`. """
+        kept = {id(f) for f in self.filters.values()}
+        for log_filter in old_filters.values():
+            if id(log_filter) not in kept and hasattr(log_filter, 'close'):
+                log_filter.close()
+
+    def _diff_handlers(self, old: dict, config: dict, configurator: logging.config.DictConfigurator,
+                       changed_filters: Set[str]) -> Dict[str, logging.Handler]:
+        changed_formatters = {
+            k for k, v in config['formatters'].items() if old['formatters'].get(k) != v
+        }
+
+        handlers = {}
+        for handler_id, handler_config in config['handlers'].items():
+            handler = self.handlers.get(handler_id)
+            changed = (
+                old['handlers'].get(handler_id) != handler_config or
+                handler_config.get('formatter') in changed_formatters or
+                not changed_filters.isdisjoint(handler_config.get('filters', []))
+            )
+            if handler is None or changed:
+                handler = self._build_handler(configurator, handler_id)
+            handlers[handler_id] = handler
+        return handlers
+
+    def _diff_filters(self, old: dict, config: dict,
+                      configurator: logging.config.DictConfigurator) -> Dict[str, logging.Filter]:
+        filters = {}
+        for filter_id, filter_config in config.get('filters', {}).items():
+            log_filter = self.filters.get(filter_id)
+            if log_filter is None or old.get('filters', {}).get(filter_id) != filter_config:
+                filter_config = configurator.config['filters'][filter_id]
+                log_filter = configurator.configure_filter(filter_config)
+            filters[filter_id] = log_filter
+        return filters
+
+    @staticmethod
+    def _build_handler(configurator: logging.config.DictConfigurator,
+                       handler_id: str) -> logging.Handler:
+        formatters = configurator.config['formatters']
+        for name in list(formatters):
+            if not isinstance(formatters[name], logging.Formatter):
+                formatters[name] = configurator.configure_formatter(formatters[name])
+
+        handler = configurator.configure_handler(configurator.config['handlers'][handler_id])
+        handler.name = handler_id
+        return handler
+
+
+live_logging = LiveLogging()
+
+
 class LoggerLoader:
 
-    def __init__(self, yml_files: List[FilePath], log_path: Optional[Path] = None):
-        self.yml_files = yml_files
-        self.config: dict = get_config(self.yml_files, 'logging')
+    def __init__(self, yml_files: Union[List[FilePath], Config], log_path: Optional[Path] = None):
+        config = yml_files if isinstance(yml_files, Config) else Config(yml_files)
+        self.yml_files = config.yml_files
+        # read-only, so load() can be called repeatedly without copying it
+        self.config: Mapping = config.section('logging')
         self.log_path = log_path
 
-    def load(self) -> LoggerConfig:
-        config = copy.deepcopy(self.config)
+    def load(self, incremental: bool = True) -> LoggerConfig:
+        """
+        Configure logging. A reload only rebuilds the handlers and filters that
+        changed, see `LiveLogging`; `incremental=False` forces a full `dictConfig`.
+        """
+        config = self.config
 
         if not config or not config.get('loggers'):
             raise ValueError("No logging configuration found")
@@ -224,9 +590,41 @@ class LoggerLoader:
             loggers=loggers
         )
 
-        logging.config.dictConfig(log_config.to_dict())
+        live_logging.apply(log_config, incremental=incremental)
         return log_config
 
 
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
+
+
+class LazyJSON:
+    """
+    Log message serialised by `json.dumps` only when a handler formats the record,
+    once however many handlers do. A record dropped by a filter is never serialised.
+    """
+    __slots__ = ('data', '_text')
+
+    def __init__(self, data: Any):
+        self.data = data
+        self._text: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self.data)
+        return self._text
+
+
+def log_json(logger: logging.Logger, level: int, data: Union[Any, Callable[[], Any]],
+             **kwargs) -> bool:
+    """
+    Log data as a JSON message if the logger is enabled for level. A callable data
+    is only called then. Returns whether the record was passed to the logger.
+
+        log_json(logger, logging.DEBUG, lambda: expensive_state(), extra={...})
+    """
+    if not logger.isEnabledFor(level):
+        return False
+
+    logger.log(level, LazyJSON(data() if callable(data) else data), **kwargs)
+    return True
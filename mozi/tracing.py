@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .handlers import worker
+from .ids import ulid
+from .utils import APP_NAME, FilePath, ensure_dir
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+MAX_REQUEST_ID_LENGTH = 128
+
+# OpenTelemetry span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+
+
+@dataclass
+class Trace:
+    """ The spans of one unit of work, e.g. a request, and its database totals. """
+    request_id: str
+    trace_id: str = field(default_factory=lambda: os.urandom(16).hex())
+    spans: List['Span'] = field(default_factory=list)  # finished spans, children first
+    queries: int = field(default=0)
+    query_time: float = field(default=0.0)  # seconds
+
+
+@dataclass
+class Span:  # pylint: disable=too-many-instance-attributes
+    name: str
+    trace: Trace = field(repr=False)
+    parent_id: Optional[str] = field(default=None)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    kind: int = field(default=KIND_INTERNAL)
+    span_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = field(default=0)
+    queries: int = field(default=0)
+    query_time: float = field(default=0.0)  # seconds
+    error: Optional[str] = field(default=None)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1_000_000
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+_exporter: Optional['FileSpanExporter'] = None  # pylint: disable=invalid-name
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace() -> Optional[Trace]:
+    current = _current_span.get()
+    return current.trace if current is not None else None
+
+
+def request_id() -> Optional[str]:
+    """ Id of the request being handled, None outside a trace. """
+    current = _current_span.get()
+    return current.trace.request_id if current is not None else None
+
+
+@contextmanager
+def _activate(item: Span) -> Iterator[Span]:
+    token = _current_span.set(item)
+    try:
+        yield item
+    except BaseException as exc:
+        item.error = f'{type(exc).__name__}: {exc}'
+        raise
+    finally:
+        _current_span.reset(token)
+        item.end_ns = time.time_ns()
+        item.trace.spans.append(item)
+
+
+@contextmanager
+def trace(name: str, request_id: Optional[str] = None,  # pylint: disable=redefined-outer-name
+          **attributes) -> Iterator[Span]:
+    """
+    Start a trace with its root span, the current span until the block exits.
+    `request_id` defaults to a new ULID. The finished trace goes to the exporter, if set.
+    """
+    root = Span(name, Trace(request_id or ulid()), attributes=attributes, kind=KIND_SERVER)
+    try:
+        with _activate(root):
+            yield root
+    finally:
+        if _exporter is not None:
+            _exporter.export(root.trace)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Time a block as a child of the current span:
+
+        with span('load_users', count=len(ids)):
+            ...
+
+    Outside a trace nothing is recorded and None is yielded.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    with _activate(Span(name, parent.trace, parent.span_id, attributes)) as child:
+        yield child
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """ Decorator running a function (sync or async) in a `span`, named after it by default. """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_query(duration: float):
+    """ Attribute a database query to the current span and its trace. """
+    current = _current_span.get()
+    if current is not None:
+        current.queries += 1
+        current.query_time += duration
+        current.trace.queries += 1
+        current.trace.query_time += duration
+
+
+class TraceFilter(logging.Filter):
+    """
+    Adds `request_id`, `trace_id` and `span_id` of the current span to every record
+    ('-' outside a trace), to be used in formats, e.g. `%(request_id)s %(message)s`.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _current_span.get()
+        if current is None:
+            record.request_id = record.trace_id = record.span_id = '-'
+        else:
+            record.request_id = current.trace.request_id
+            record.trace_id = current.trace.trace_id
+            record.span_id = current.span_id
+        return True
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items()]
+
+
+def _otlp_span(item: Span) -> dict:
+    attributes = dict(item.attributes)
+    queries, query_time = item.queries, item.query_time
+    if item.parent_id is None:
+        # the root carries the totals of the request
+        attributes['request.id'] = item.trace.request_id
+        queries, query_time = item.trace.queries, item.trace.query_time
+    if queries:
+        attributes['db.queries'] = queries
+        attributes['db.time_ms'] = round(query_time * 1000, 3)
+
+    data = {
+        'traceId': item.trace.trace_id,
+        'spanId': item.span_id,
+        'name': item.name,
+        'kind': item.kind,
+        'startTimeUnixNano': str(item.start_ns),
+        'endTimeUnixNano': str(item.end_ns),
+        'attributes': _otlp_attributes(attributes),
+        'status': {'code': 2, 'message': item.error} if item.error else {},
+    }
+    if item.parent_id is not None:
+        data['parentSpanId'] = item.parent_id
+    return data
+
+
+def to_otlp(finished: Trace, service_name: str = APP_NAME) -> dict:
+    """ The trace as an OTLP/JSON `ExportTraceServiceRequest`. """
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': service_name})},
+            'scopeSpans': [{
+                'scope': {'name': 'mozi.tracing'},
+                'spans': [_otlp_span(s) for s in finished.spans],
+            }],
+        }],
+    }
+
+
+class FileSpanExporter:
+    """
+    Appends every finished trace to `path` as one line of OTLP/JSON, the format read
+    by the OpenTelemetry collector's `otlpjsonfile` receiver. Traces are serialised and
+    written by the background worker of the log handlers, not on the request path.
+    """
+
+    def __init__(self, path: FilePath, service_name: str = APP_NAME):
+        self.path = os.path.abspath(path)
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        ensure_dir(os.path.dirname(self.path))
+
+    def export(self, finished: Trace):
+        worker.submit(functools.partial(self._write, finished))
+
+    def _write(self, finished: Trace):
+        line = json.dumps(to_otlp(finished, self.service_name), separators=(',', ':'))
+        with self._lock, open(self.path, 'a', encoding='utf-8') as export_file:
+            export_file.write(line + '\n')
+
+
+def set_exporter(exporter: Optional[FileSpanExporter]):
+    """ Export finished traces with `exporter`, None to stop exporting. """
+    global _exporter  # pylint: disable=global-statement
+    _exporter = exporter
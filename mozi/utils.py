@@ -1,13 +1,16 @@
-import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import hashlib
 import hmac
 import os
 import time
-from typing import List, Optional
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
 import pytz
 import yaml
 
+from .ids import short_hash
+
 APP_NAME = os.environ.get("APP_NAME", "mozi")
 APP_ENV = os.environ.get("APP_ENV", "dev")
 
@@ -32,6 +35,10 @@ def is_debug() -> bool:
     return is_dev() or is_test()
 
 
+# Directories ensured by this process, they are not checked again.
+_ensured_dirs: Set[Path] = set()
+
+
 def ensure_dir(directory: Path) -> Path:
     """ Create directory if it doesn't exist. """
     directory = directory.strip()
@@ -39,20 +46,24 @@ def ensure_dir(directory: Path) -> Path:
         raise ValueError("Param directory is empty.")
 
     directory = os.path.normpath(directory)
-    if os.path.exists(directory):
-        if not os.path.isdir(directory):
-            raise ValueError(f"Not a directory: {directory}")
-    else:
-        head, tail = os.path.split(directory)
-        if not tail and head == "/":
-            raise OSError(f"Root directory missing? {directory}")
-        if head:
-            ensure_dir(head)
+    if directory in _ensured_dirs:
+        return directory
 
-        os.mkdir(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except (FileExistsError, NotADirectoryError) as exc:
+        # the directory or one of its parents is a file
+        raise ValueError(f"Not a directory: {directory}") from exc
+
+    _ensured_dirs.add(directory)
     return directory
 
 
+def clear_ensured_dirs():
+    """ Forget the ensured directories, e.g. after removing them. """
+    _ensured_dirs.clear()
+
+
 def now(timezone: str = "Asia/Shanghai"):
     return datetime.now(tz=pytz.timezone(timezone))
 
@@ -72,29 +83,198 @@ def utc2datetime(utc_str: str, timezone: str = 'Asia/Shanghai') -> datetime:
     return utc_time.astimezone(tz=pytz.timezone(timezone))
 
 
+def _to_bytes(data: Union[str, bytes]) -> bytes:
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+
+class HMACSigner:
+    """
+    HMAC signer for one secret. The keyed inner/outer hash state is computed once
+    and copied for every message, instead of re-keying a new `hmac` object.
+
+        signer = HMACSigner(api_secret)
+        signatures = signer.sign_many(messages, workers=4)
+        signer.verify(message, signature)
+    """
+
+    def __init__(self, secret: Union[str, bytes], digestmod: Callable = hashlib.sha256):
+        self._hmac = hmac.new(_to_bytes(secret), digestmod=digestmod)
+
+    def digest(self, message: Union[str, bytes]) -> bytes:
+        m = self._hmac.copy()
+        m.update(_to_bytes(message))
+        return m.digest()
+
+    def sign(self, message: Union[str, bytes]) -> str:
+        m = self._hmac.copy()
+        m.update(_to_bytes(message))
+        return m.hexdigest()
+
+    def sign_many(self, messages: Sequence[Union[str, bytes]], workers: int = 1) -> List[str]:
+        """
+        Sign messages in order. With `workers > 1` the messages are split into one
+        slice per thread; hashlib releases the GIL for inputs over 2 KiB, so this
+        only pays off for large messages.
+        """
+        if workers <= 1 or len(messages) < 2:
+            return [self.sign(message) for message in messages]
+
+        size = -(-len(messages) // workers)
+        slices = [messages[i:i + size] for i in range(0, len(messages), size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = executor.map(lambda part: [self.sign(message) for message in part], slices)
+        return [signature for part in parts for signature in part]
+
+    def verify(self, message: Union[str, bytes], signature: Union[str, bytes]) -> bool:
+        """ Constant-time comparison of the expected hex signature with `signature`. """
+        return hmac.compare_digest(self.sign(message).encode(), _to_bytes(signature))
+
+    def verify_many(
+        self,
+        messages: Sequence[Union[str, bytes]],
+        signatures: Sequence[Union[str, bytes]],
+        workers: int = 1,
+    ) -> List[bool]:
+        if len(messages) != len(signatures):
+            raise ValueError(f"Got {len(messages)} messages but {len(signatures)} signatures")
+
+        expected = self.sign_many(messages, workers=workers)
+        return [hmac.compare_digest(e.encode(), _to_bytes(s)) for e, s in zip(expected, signatures)]
+
+
 def hmac_sha256(api_secret: str, message: str) -> str:
+    """ One-off signature, keep an `HMACSigner` to sign many messages with one secret. """
     m = hmac.new(api_secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256)
     return m.hexdigest()
 
 
 def uuid(message: str, length: int = 8) -> str:
-    hash_bytes = hashlib.sha256(message.encode("utf-8")).digest()
-    result = base64.urlsafe_b64encode(hash_bytes).decode("utf-8")
-    return result[:length]
+    """ Deterministic short id of message, see `mozi.ids` for time-ordered unique ids. """
+    return short_hash(message, length)
 
 
-def deep_update(dict1: dict, dict2: dict) -> dict:
+LIST_STRATEGIES = ('replace', 'append', 'keyed')
+_LISTS = (list, tuple)  # a frozen list is a tuple
+_MISSING = object()
+
+
+def _merge_lists(current: Sequence, value: Sequence, lists: str, key: str, stack: list,
+                 owned: Optional[set]) -> list:
+    if lists == 'append':
+        return [*current, *value]
+
+    # keyed: mappings with the same `key` are merged, anything else is appended
+    result = list(current)
+    index = {}
+    for i, item in enumerate(result):
+        if isinstance(item, Mapping) and key in item:
+            index[item[key]] = i
+
+    for item in value:
+        item_key = item.get(key, _MISSING) if isinstance(item, Mapping) else _MISSING
+        i = None if item_key is _MISSING else index.get(item_key)
+        if i is None:
+            if item_key is not _MISSING:
+                index[item_key] = len(result)
+            result.append(item)
+            continue
+
+        merged = dict(result[i])
+        if owned is not None:
+            owned.add(id(merged))
+        result[i] = merged
+        stack.append((merged, item))
+    return result
+
+
+def _merge(target: dict, source: Mapping, lists: str, key: str, owned: Optional[set]):
     """
-    Recursively updates dict1 with values from dict2.
+    Merge source into target with an explicit stack instead of recursion.
+    `owned` holds the ids of the dicts created by this merge, any other nested dict
+    is copied before it is changed. Without it nested dicts are updated in place.
     """
-    for key, value in dict2.items():
-        if isinstance(value, dict) and key in dict1 and isinstance(dict1[key], dict):
-            deep_update(dict1[key], value)
-        else:
-            dict1[key] = value
+    stack = [(target, source)]
+    while stack:
+        dst, src = stack.pop()
+        for k, value in src.items():
+            current = dst.get(k, _MISSING)
+            if isinstance(value, Mapping) and isinstance(current, Mapping):
+                shared = owned is not None and id(current) not in owned
+                if shared or not isinstance(current, dict):
+                    current = dst[k] = dict(current)
+                    if owned is not None:
+                        owned.add(id(current))
+                stack.append((current, value))
+            elif lists != 'replace' and isinstance(value, _LISTS) and isinstance(current, _LISTS):
+                dst[k] = _merge_lists(current, value, lists, key, stack, owned)
+            else:
+                dst[k] = value
+
+
+def deep_update(dict1: dict, dict2: Mapping, lists: str = 'replace', key: str = 'name') -> dict:
+    """
+    Updates dict1 in place with values from dict2, nested dicts are merged.
+    lists: 'replace' the list of dict1, 'append' to it, or 'keyed' to merge list
+           items that are dicts with the same `key`.
+    """
+    if lists not in LIST_STRATEGIES:
+        raise ValueError(f"Unknown list strategy: {lists}")
+
+    _merge(dict1, dict2, lists, key, None)
     return dict1
 
 
+def deep_merge(*layers: Mapping, lists: str = 'replace', key: str = 'name',
+               frozen: bool = False) -> Mapping:
+    """
+    Merge layers into a new dict without changing them, later layers win.
+    Subtrees that only one layer has are shared with that layer rather than
+    copied; only dicts present in several layers are copied and merged.
+    frozen: return a read-only result (see `freeze`) that callers can share
+            without `deepcopy`.
+    """
+    if lists not in LIST_STRATEGIES:
+        raise ValueError(f"Unknown list strategy: {lists}")
+
+    result: dict = {}
+    owned = {id(result)}
+    for layer in layers:
+        _merge(result, layer, lists, key, owned)
+    return freeze(result) if frozen else result
+
+
+def freeze(data: Any) -> Any:
+    """
+    Read-only copy of data: dicts become `MappingProxyType` and lists become
+    tuples. A subtree shared by several parents is frozen once.
+    """
+    containers = (Mapping, list, tuple)
+    if not isinstance(data, containers):
+        return data
+
+    frozen: Dict[int, Any] = {}
+
+    def get(value: Any) -> Any:
+        return frozen[id(value)] if isinstance(value, containers) else value
+
+    # post-order without recursion: a container is built after all its children
+    stack = [(data, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in frozen:
+            continue
+
+        children = node.values() if isinstance(node, Mapping) else node
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((c, False) for c in children if isinstance(c, containers))
+        elif isinstance(node, Mapping):
+            frozen[id(node)] = MappingProxyType({k: get(v) for k, v in node.items()})
+        else:
+            frozen[id(node)] = tuple(get(v) for v in node)
+    return frozen[id(data)]
+
+
 def get_config(yml_files: List[FilePath], key: Optional[str] = None) -> dict:
     config_data = {}
     for path in yml_files:
@@ -105,11 +285,160 @@ def get_config(yml_files: List[FilePath], key: Optional[str] = None) -> dict:
     return config_data
 
 
-def sort_list(data: dict) -> dict:
-    """ Sort list in dict. """
-    for _, val in data.items():
-        if isinstance(val, list):
-            val.sort()
-        elif isinstance(val, dict):
-            sort_list(val)  # Recursively handle nested dicts
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+_SETS = (set, frozenset)
+
+
+def _encode(value: Any, digests: Dict[int, bytes]) -> bytes:
+    """ Unambiguous bytes of a value, a container is represented by its digest. """
+    if isinstance(value, _CONTAINERS) and id(value) in digests:
+        return b'h' + digests[id(value)]
+    if value is None or isinstance(value, bool):
+        return {None: b'n', True: b't', False: b'f'}[value]
+    if isinstance(value, int):
+        data, tag = str(value).encode(), b'i'
+    elif isinstance(value, float):
+        data, tag = repr(value).encode(), b'd'
+    elif isinstance(value, str):
+        data, tag = value.encode('utf-8', 'surrogatepass'), b's'
+    elif isinstance(value, bytes):
+        data, tag = value, b'b'
+    else:
+        data, tag = f'{type(value).__qualname__}:{value!r}'.encode(), b'o'
+    return tag + len(data).to_bytes(4, 'big') + data
+
+
+# bool before int, it is a subclass of int
+_RANKS = ((1, bool), (2, (int, float)), (4, str), (5, bytes))
+
+
+def _sort_key(value: Any, keys: Dict[int, tuple]) -> tuple:
+    """ Orders mixed types: None, bools, numbers, NaN, strings, bytes, containers, others. """
+    if value is None:
+        return (0,)
+    if isinstance(value, float) and value != value:  # pylint: disable=comparison-with-itself
+        return (3,)  # NaN does not compare
+    for rank, types in _RANKS:
+        if isinstance(value, types):
+            return (rank, value)
+    if isinstance(value, _CONTAINERS):
+        return keys[id(value)]
+    return (7, type(value).__qualname__, repr(value))
+
+
+def _container_key(node: Any, keys: Dict[int, tuple]) -> tuple:
+    """ Sort key of a container: its type, then the sort keys of its (sorted) children. """
+    if isinstance(node, dict):
+        items = sorted((_sort_key(k, keys), _sort_key(v, keys)) for k, v in node.items())
+        return (6, 2, tuple(items))
+    if isinstance(node, _SETS):
+        items = sorted(_sort_key(v, keys) for v in node)
+        return (6, 4 if isinstance(node, frozenset) else 3, tuple(items))
+    return (6, 0 if isinstance(node, list) else 1, tuple(_sort_key(v, keys) for v in node))
+
+
+def _digest(node: Any, digests: Dict[int, bytes], keys: Dict[int, tuple]) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    if not isinstance(node, _CONTAINERS):
+        h.update(b'=' + _encode(node, digests))
+    elif isinstance(node, dict):
+        h.update(b'{' + len(node).to_bytes(4, 'big'))
+        for key in sorted(node, key=lambda k: _sort_key(k, keys)):
+            h.update(_encode(key, digests))
+            h.update(_encode(node[key], digests))
+    elif isinstance(node, _SETS):
+        # hashed as sorted sequences, iteration order depends on PYTHONHASHSEED
+        h.update((b'>' if isinstance(node, frozenset) else b'<') + len(node).to_bytes(4, 'big'))
+        for item in sorted(node, key=lambda v: _sort_key(v, keys)):
+            h.update(_encode(item, digests))
+    else:
+        h.update((b'[' if isinstance(node, list) else b'(') + len(node).to_bytes(4, 'big'))
+        for item in node:
+            h.update(_encode(item, digests))
+    return h.digest()
+
+
+def _needs(data: Any, with_digest: bool) -> Dict[int, Tuple[Any, bool, bool]]:
+    """
+    Every container in data with whether it needs a sort key (it is sorted among
+    other values) and a digest. A container reached by several paths gets the
+    needs of all of them.
+    """
+    needs: Dict[int, Tuple[Any, bool, bool]] = {}
+    stack = [(data, False, with_digest)]
+    while stack:
+        node, key, digest = stack.pop()
+        _, has_key, has_digest = needs.get(id(node), (node, False, False))
+        if id(node) in needs and key <= has_key and digest <= has_digest:
+            continue
+        key, digest = key or has_key, digest or has_digest
+        needs[id(node)] = (node, key, digest)
+
+        if isinstance(node, dict):
+            children = [(k, key or digest) for k in node]
+            children.extend((v, key) for v in node.values())
+        else:
+            sorted_children = key or isinstance(node, list) or (digest and isinstance(node, _SETS))
+            children = [(c, sorted_children) for c in node]
+        stack.extend((c, k, digest) for c, k in children if isinstance(c, _CONTAINERS))
+    return needs
+
+
+def _canonicalize(data: Any, with_digest: bool) -> Optional[bytes]:
+    """
+    Post-order walk without recursion: a container is handled after its children,
+    lists are sorted in place and containers are hashed once. Containers are
+    ordered by a type-aware key built from their children, digests are only
+    computed for hashing. Dict keys (e.g. tuples) are walked like values.
+    """
+    if not isinstance(data, _CONTAINERS):
+        return _digest(data, {}, {}) if with_digest else None
+
+    needs = _needs(data, with_digest)
+    keys: Dict[int, tuple] = {}
+    digests: Dict[int, bytes] = {}
+    done = set()
+    stack = [(data, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in done:
+            continue
+
+        if not expanded:
+            stack.append((node, True))
+            children = [*node, *node.values()] if isinstance(node, dict) else node
+            stack.extend((c, False) for c in children if isinstance(c, _CONTAINERS))
+            continue
+
+        done.add(id(node))
+        _, key, digest = needs[id(node)]
+        if isinstance(node, list):
+            node.sort(key=lambda v: _sort_key(v, keys))
+        if key:
+            keys[id(node)] = _container_key(node, keys)
+        if digest:
+            digests[id(node)] = _digest(node, digests, keys)
+    return digests.get(id(data))
+
+
+def canonicalize(data: Any) -> Any:
+    """
+    Sort every list nested in data in place, including lists inside lists, with a
+    stable type-aware order, so mixed-type lists do not raise. Tuples keep their order.
+    """
+    _canonicalize(data, with_digest=False)
     return data
+
+
+def canonical_hash(data: Any) -> str:
+    """
+    Hash that is equal for equal data regardless of dict key and list order, e.g.
+    for cache keys and change detection. Canonicalizes data in place and hashes it
+    in the same pass.
+    """
+    return _canonicalize(data, with_digest=True).hex()  # type: ignore
+
+
+def sort_list(data: dict) -> dict:
+    """ Sort list in dict, see `canonicalize`. """
+    return canonicalize(data)
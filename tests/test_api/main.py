@@ -1,7 +1,17 @@
-from fastapi import APIRouter
+import asyncio
+from typing import List
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, create_engine
 
-from mozi.api import APIError, LogRequestRoute
+from mozi.api import (
+    APIError, CSVResponse, JSONArrayResponse, LogRequestRoute, MemoryCache, NDJSONResponse,
+    SessionDependency, cache_route
+)
 from mozi.api.app import app
+from mozi.db import create_db_and_tables
+from mozi.tracing import span
+from tests.test_db.user import User
 
 router = APIRouter(
     prefix="/demo",
@@ -19,4 +29,108 @@ async def hello():
 async def error():
     raise APIError('this is a test error.')
 
+
+@router.get("/validate")
+async def validate(limit: int, ids: list[int] = Query(default=[])):  # pylint: disable=unused-argument
+    return {"limit": limit}
+
+
+@router.get("/crash")
+async def crash():
+    raise RuntimeError('x' * 2000)
+
 app.include_router(router)
+
+
+cache_backend = MemoryCache(max_size=2)
+cache_calls = {'items': 0}
+cache_router = APIRouter(
+    prefix="/cache",
+    tags=["cache"],
+    route_class=cache_route(ttl=60, vary=['Accept-Language'], backend=cache_backend,
+                            route_class=LogRequestRoute),
+)
+
+
+@cache_router.get("/items")
+async def cached_items(limit: int = 2):
+    cache_calls['items'] += 1
+    return {"items": list(range(limit)), "calls": cache_calls['items']}
+
+
+@cache_router.get("/slow")
+async def cached_slow():
+    await asyncio.sleep(0.05)
+    cache_calls['items'] += 1
+    return {"calls": cache_calls['items']}
+
+
+@cache_router.get("/ids")
+async def cached_ids(ids: List[int] = Query(default=[])):
+    cache_calls['items'] += 1
+    return {"ids": ids, "calls": cache_calls['items']}
+
+
+@cache_router.get("/headers")
+async def cached_headers(response: Response, cookie: bool = False):
+    cache_calls['items'] += 1
+    response.headers['X-Custom'] = 'custom'
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    if cookie:
+        response.set_cookie('session', 'secret')
+    return {"calls": cache_calls['items']}
+
+
+@cache_router.get("/error")
+async def cached_error():
+    cache_calls['items'] += 1
+    raise APIError('not cached')
+
+app.include_router(cache_router)
+
+
+engine = create_engine("sqlite://", connect_args={'check_same_thread': False}, poolclass=StaticPool)
+create_db_and_tables(engine)
+get_session = SessionDependency(engine)
+db_router = APIRouter(
+    prefix="/db",
+    tags=["db"],
+    route_class=LogRequestRoute,
+)
+
+
+@db_router.get("/users")
+def count_users(session: Session = Depends(get_session)):
+    return {"count": User.count(session)}
+
+
+@db_router.post("/users")
+async def add_user(name: str, fail: bool = False, session: Session = Depends(get_session)):
+    session.add(User(name=name))
+    if fail:
+        raise APIError('rollback')
+    return {"name": name}
+
+
+@db_router.get("/traced")
+def traced_users(session: Session = Depends(get_session)):
+    with span('count_users', table='user'):
+        count = User.count(session)
+    return {"count": count}
+
+
+@db_router.get("/nodb")
+def nodb(session: Session = Depends(get_session)):  # pylint: disable=unused-argument
+    return {}
+
+
+EXPORTS = {'ndjson': NDJSONResponse, 'json': JSONArrayResponse, 'csv': CSVResponse}
+
+
+@db_router.get("/export/{fmt}")
+def export(fmt: str, request: Request, chunk_size: int = 2,
+           session: Session = Depends(get_session)):
+    return EXPORTS[fmt](request, User.iter_chunks(session, chunk_size=chunk_size))
+
+
+app.include_router(db_router)
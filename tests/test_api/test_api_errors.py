@@ -1,5 +1,16 @@
+import asyncio
+import json
+from unittest.mock import patch
+from fastapi import Request
+from fastapi.testclient import TestClient
+
 from mozi.api import APIError
+from mozi.api.app import custom_error_handler
+from mozi.api.api_logger import logger as api_logger
+from mozi.api.errors import MAX_DETAIL_LENGTH, error_body, validation_body
+from mozi.logger import SamplingFilter
 from . import client
+from .main import app
 
 
 def test_index():
@@ -16,3 +27,76 @@ def test_error():
 
     data = response.json()
     data["error_code"] = APIError.error_code
+
+
+def test_error_body():
+    assert json.loads(error_body(100, 'oops')) == {"error_code": 100, "detail": "oops"}
+    assert json.loads(error_body(101, None)) == {"error_code": 101, "detail": None}
+
+    detail = json.loads(error_body(100, 'x' * 5000))["detail"]
+    assert len(detail) == MAX_DETAIL_LENGTH
+    assert detail.endswith('...')
+
+
+def test_validation_error():
+    with patch('mozi.api.api_logger.logger') as mock_logger:
+        response = client.get("/demo/validate", params={'limit': 'abc', 'ids': ['1', 'x']})
+
+    assert response.status_code == 422
+    assert response.json() == {
+        "error_code": 102,
+        "detail": "Invalid  query.limit: Input should be a valid integer, unable to parse "
+                  "string as an integer; query.ids.1: Input should be a valid integer, "
+                  "unable to parse string as an integer;",
+    }
+
+    log = json.loads(str(mock_logger.error.call_args.args[0]))
+    assert log["c"] == 422
+    assert log["detail"] == response.json()["detail"]
+
+    # identical failures are served from the cache
+    hits = validation_body.cache_info().hits  # pylint: disable=no-value-for-parameter
+    assert client.get("/demo/validate", params={'limit': 'abc', 'ids': ['1', 'x']}).content == response.content  # pylint: disable=line-too-long
+    assert validation_body.cache_info().hits == hits + 1  # pylint: disable=no-value-for-parameter
+
+
+def test_unhandled_error():
+    request = Request({'type': 'http', 'method': 'GET', 'path': '/demo/crash', 'headers': []})
+    with patch('mozi.api.app.logger') as mock_logger:
+        response = asyncio.run(custom_error_handler(request, RuntimeError('x' * 2000)))
+
+    assert response.status_code == 500
+    assert response.body.startswith(b"Internal Server Error: xxx")
+    assert len(response.body) == MAX_DETAIL_LENGTH
+    assert mock_logger.error.call_count == 1
+
+    # access log detail is bounded too
+    with patch('mozi.api.api_logger.logger') as mock_logger:
+        TestClient(app, raise_server_exceptions=False).get("/demo/crash")
+    assert len(json.loads(str(mock_logger.error.call_args.args[0]))["detail"]) == MAX_DETAIL_LENGTH
+
+
+def test_api_log_disabled():
+    with patch('mozi.api.api_logger.logger') as mock_logger, \
+            patch('mozi.api.api_logger.APILogger.get_body') as mock_get_body:
+        mock_logger.isEnabledFor.return_value = False
+        client.get("/demo/hello")
+        client.get("/demo/error")
+
+    mock_get_body.assert_not_called()
+    mock_logger.info.assert_not_called()
+    mock_logger.error.assert_not_called()
+
+
+def test_api_log_sampled_out():
+    sampling = SamplingFilter(default=0)
+    api_logger.addFilter(sampling)
+    try:
+        with patch('mozi.api.api_logger.APILogger.get_body') as mock_get_body, \
+                patch.object(api_logger, 'info') as mock_info:
+            client.get("/demo/hello")
+    finally:
+        api_logger.removeFilter(sampling)
+
+    mock_get_body.assert_not_called()
+    mock_info.assert_not_called()
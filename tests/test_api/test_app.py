@@ -0,0 +1,80 @@
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from mozi.api import APIError
+from mozi.api.api_logger import logger
+from mozi.api import app as app_module
+from mozi.api.app import create_app, get_app, warm_up
+from mozi.api.profiling import ProfileConfig, profiler
+from mozi.api.responses import FastJSONResponse
+
+
+def test_create_app(tmp_path):
+    config_file = tmp_path / 'app.yml'
+    config_file.write_text(
+        'api:\n  docs: false\n  title: demo\n  gzip_minimum_size: 10\n  pool_warm_up: 2\n'
+    )
+    engine = create_engine(f'sqlite:///{tmp_path}/app.db', poolclass=QueuePool, pool_size=3)
+    events = []
+
+    @asynccontextmanager
+    async def lifespan(_):
+        events.append('start')
+        yield
+        events.append('stop')
+
+    app = create_app([config_file], engine=engine, lifespan=lifespan)
+    assert app.title == 'demo'
+    assert app.openapi_url is None
+    assert app.router.default_response_class is FastJSONResponse
+
+    @app.get('/items')
+    def items():
+        return [{'id': i} for i in range(10)]
+
+    @app.get('/error')
+    def error():
+        raise APIError()
+
+    with patch('mozi.api.app.warm_up') as mock_warm_up:
+        with TestClient(app) as client:
+            assert events == ['start']
+            mock_warm_up.assert_called_once_with(engine, 2)
+
+            assert client.get('/docs').status_code == 404
+            assert client.get('/items').headers['content-encoding'] == 'gzip'
+            assert client.get('/error').json()['error_code'] == APIError.error_code
+    assert events == ['start', 'stop']
+
+    warm_up(engine, 2)
+    assert engine.pool.checkedin() == 2
+
+
+def test_default_app():
+    app = create_app()
+    assert app.openapi_url == '/openapi.json'
+    assert not app.user_middleware
+
+
+def test_get_app():
+    assert get_app() is get_app() is app_module.app
+
+
+def test_profile_config(tmp_path):
+    config_file = tmp_path / 'app.yml'
+    config_file.write_text(f"""
+api:
+  profile: {{token: secret}}
+logging:
+  log_path: {tmp_path}/logs
+  loggers:
+    {logger.name}:
+      handlers: [file]
+""")
+    app = create_app([config_file])
+    with TestClient(app):
+        assert profiler.config == ProfileConfig(token='secret', path=f'{tmp_path}/logs/profiles')
+    assert profiler.config is None
@@ -0,0 +1,142 @@
+# pylint: disable=protected-access
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from fastapi import Request
+import httpx
+
+import pytest
+
+from mozi.api import CacheBackend, CachedResponse, CacheRoute, MemoryCache
+from . import client
+from .main import app, cache_backend, cache_calls
+
+
+class TestMemoryCache(TestCase):
+
+    def test_lru_and_ttl(self):
+        cache = MemoryCache(max_size=2)
+
+        async def run():
+            await cache.set('a', CachedResponse(b'a'), ttl=60)
+            await cache.set('b', CachedResponse(b'b'), ttl=60)
+            assert (await cache.get('a')).body == b'a'  # a is now most recently used
+            await cache.set('c', CachedResponse(b'c'), ttl=60)
+            assert await cache.get('b') is None
+            assert len(cache) == 2
+
+            await cache.set('d', CachedResponse(b'd'), ttl=0)
+            assert await cache.get('d') is None
+
+        asyncio.run(run())
+
+        with self.assertRaises(ValueError):
+            MemoryCache(max_size=0)
+
+    def test_abstract_backend(self):
+        class Incomplete(CacheBackend):  # pylint: disable=abstract-method
+            async def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            Incomplete()  # pylint: disable=abstract-class-instantiated
+
+
+class TestCacheRoute(TestCase):
+
+    def setUp(self):
+        cache_backend._data.clear()
+        cache_calls['items'] = 0
+        return super().setUp()
+
+    def test_cache_hit(self):
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            first = client.get("/cache/items", params={'limit': 3})
+            second = client.get("/cache/items?limit=3")
+
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json() == {"items": [0, 1, 2], "calls": 1}
+        assert first.headers['etag'] == second.headers['etag']
+
+        logs = [json.loads(str(c.args[0])) for c in mock_logger.info.call_args_list]
+        stats = [(log['ca'], log['ch'], log['cm']) for log in logs]
+        assert stats == [('miss', 0, 1), ('hit', 1, 1)]
+
+        # different query or vary header is another entry
+        assert client.get("/cache/items?limit=1").json()["calls"] == 2
+        response = client.get("/cache/items?limit=1", headers={'Accept-Language': 'zh'})
+        assert response.json()["calls"] == 3
+
+    def test_not_modified(self):
+        etag = client.get("/cache/items").headers['etag']
+
+        response = client.get("/cache/items", headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+        assert not response.content
+
+        response = client.get("/cache/items", headers={'If-None-Match': '"stale"'})
+        assert response.status_code == 200
+        assert cache_calls['items'] == 1
+
+    def test_error_not_cached(self):
+        assert client.get("/cache/error").status_code == 400
+        assert client.get("/cache/error").status_code == 400
+        assert cache_calls['items'] == 2
+
+    def test_single_flight(self):
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as aclient:
+                return await asyncio.gather(*(aclient.get("/cache/slow") for _ in range(5)))
+
+        responses = asyncio.run(run())
+        assert [r.json() for r in responses] == [{"calls": 1}] * 5
+
+    def test_leader_cancelled(self):
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as aclient:
+                leader = asyncio.create_task(aclient.get("/cache/slow"))
+                await asyncio.sleep(0.01)
+                waiter = asyncio.create_task(aclient.get("/cache/slow"))
+                await asyncio.sleep(0.01)
+                leader.cancel()
+                return await asyncio.wait_for(waiter, timeout=1)
+
+        # the waiter does not hang, it computes the response itself
+        assert asyncio.run(run()).json() == {"calls": 1}
+
+    def test_query_order(self):
+        first = client.get("/cache/ids?ids=1&ids=2&limit=1")
+        assert client.get("/cache/ids?limit=1&ids=1&ids=2").json() == first.json()
+        assert first.json() == {"ids": [1, 2], "calls": 1}
+        assert client.get("/cache/ids?ids=2&ids=1").json() == {"ids": [2, 1], "calls": 2}
+
+    def test_vary_quoted(self):
+        route = SimpleNamespace(vary=('a', 'b'))
+        request = Request({'type': 'http', 'method': 'GET', 'path': '/x', 'query_string': b'',
+                           'headers': [(b'a', b'1&b=2')]})
+        other = Request({'type': 'http', 'method': 'GET', 'path': '/x', 'query_string': b'',
+                         'headers': [(b'a', b'1'), (b'b', b'2')]})
+        assert CacheRoute.cache_key(route, request) != CacheRoute.cache_key(route, other)
+
+    def test_endpoint_headers(self):
+        first = client.get("/cache/headers")
+        second = client.get("/cache/headers")
+        assert first.json() == second.json() == {"calls": 1}
+        for response in (first, second):
+            assert response.headers['x-custom'] == 'custom'
+            assert response.headers['cache-control'] == 'public, max-age=60'
+            assert response.headers['content-type'] == 'application/json'
+            assert response.headers['etag'] == first.headers['etag']
+        assert second.headers['x-request-id'] != first.headers['x-request-id']
+
+    def test_cookie_not_cached(self):
+        first = client.get("/cache/headers", params={'cookie': True})
+        second = client.get("/cache/headers", params={'cookie': True})
+        assert first.json() == {"calls": 1}
+        assert second.json() == {"calls": 2}
+        assert 'session=secret' in second.headers['set-cookie']
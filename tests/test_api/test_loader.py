@@ -0,0 +1,109 @@
+# pylint: disable=protected-access
+import asyncio
+import time
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from mozi.api import Loaders, ModelLoader
+from tests.test_db.base import TEST_DB_URI, DBTestCase
+from tests.test_db.user import User
+
+
+class TestModelLoader(DBTestCase):
+
+    def test_load_batches_same_tick(self):
+        with Session(self.engine) as session:
+            for name in ['foo', 'bar', 'baz']:
+                User.create(session, name=name)
+
+            loader = ModelLoader(User, session)
+
+            async def run():
+                return await asyncio.gather(loader.load(3), loader.load(1), loader.load(4))
+
+            with patch.object(User, 'gets_by_ids', wraps=User.gets_by_ids) as mock_gets:
+                users = asyncio.run(run())
+                assert mock_gets.call_count == 1
+                assert sorted(mock_gets.call_args[0][1]) == [1, 3, 4]
+
+            assert [u.name if u else None for u in users] == ['baz', 'foo', None]
+
+    def test_load_many_memoises(self):
+        with Session(self.engine) as session:
+            for name in ['foo', 'bar', 'baz']:
+                User.create(session, name=name)
+
+            loaders = Loaders(session)
+            loader = loaders[User]
+            assert loaders[User] is loader
+
+            async def run():
+                first = await loader.load_many([2, 1, 2, 3])
+                second = await loader.load(1)
+                return first, second
+
+            with patch.object(User, 'gets_by_ids', wraps=User.gets_by_ids) as mock_gets:
+                users, user = asyncio.run(run())
+                # duplicated ids are loaded once
+                assert mock_gets.call_count == 1
+                assert mock_gets.call_args[0][1] == [2, 1, 3]
+
+            assert [u.name for u in users] == ['bar', 'foo', 'bar', 'baz']
+            assert user.name == 'foo'
+
+    def test_load_error(self):
+        with Session(self.engine) as session:
+            loader = ModelLoader(User, session)
+
+            async def run():
+                return await loader.load(1)
+
+            with patch.object(User, 'gets_by_ids', side_effect=RuntimeError('boom')):
+                with self.assertRaisesRegex(RuntimeError, 'boom'):
+                    asyncio.run(run())
+            assert not loader._futures
+
+    def test_load_off_loop(self):
+        with Session(self.engine) as session:
+            User.create(session, name='foo')
+            loader = ModelLoader(User, session)
+            ticks = []
+            gets_by_ids = User.gets_by_ids
+
+            def slow_gets(*args, **kwargs):
+                time.sleep(0.1)
+                return gets_by_ids(*args, **kwargs)
+
+            async def tick():
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            async def run():
+                return (await asyncio.gather(loader.load(1), tick()))[0]
+
+            with patch.object(User, 'gets_by_ids', side_effect=slow_gets):
+                user = asyncio.run(run())
+
+            # the loop kept running while the batch was loaded
+            assert user.name == 'foo'
+            assert len(ticks) == 5
+            assert ticks[-1] - ticks[0] < 0.1
+
+    def test_load_async_session(self):
+        with Session(self.engine) as session:
+            for name in ['foo', 'bar']:
+                User.create(session, name=name)
+
+        async def run():
+            engine = create_async_engine(TEST_DB_URI.replace('sqlite:', 'sqlite+aiosqlite:'))
+            try:
+                async with AsyncSession(engine) as async_session:
+                    loaders = Loaders(async_session)
+                    return await loaders[User].load_many([2, 3, 1])
+            finally:
+                await engine.dispose()
+
+        assert [u.name if u else None for u in asyncio.run(run())] == ['bar', None, 'foo']
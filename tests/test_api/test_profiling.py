@@ -0,0 +1,51 @@
+import json
+import os
+import pstats
+from unittest import TestCase
+from unittest.mock import patch
+import pytest
+
+from mozi.api.profiling import PROFILE_HEADER, ProfileConfig, profiler
+from mozi.tracing import REQUEST_ID_HEADER
+from . import client
+
+
+class TestRequestProfiler(TestCase):
+
+    @pytest.fixture(autouse=True)
+    def tmp_dir(self, tmp_path):
+        self.path = str(tmp_path / 'profiles')  # pylint: disable=attribute-defined-outside-init
+
+    def tearDown(self):
+        profiler.configure(None)
+
+    def get(self, headers=None) -> dict:
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            client.get("/db/users", headers=headers)
+        return json.loads(str(mock_logger.info.call_args.args[0]))
+
+    def test_disabled(self):
+        assert 'pf' not in self.get({PROFILE_HEADER: '1'})
+
+    def test_header(self):
+        profiler.configure(ProfileConfig(token='secret', path=self.path))
+        assert 'pf' not in self.get()
+        assert 'pf' not in self.get({PROFILE_HEADER: 'wrong'})
+
+        log = self.get({PROFILE_HEADER: 'secret', REQUEST_ID_HEADER: '../req 1'})
+        assert log['pf'] == os.path.join(self.path, '___req_1.prof')
+        stats = pstats.Stats(log['pf'])
+        assert any(func == 'count_users' for _, _, func in stats.stats)  # type: ignore
+
+    def test_rate(self):
+        profiler.configure(ProfileConfig(rate=1, path=self.path))
+        log = self.get()
+        assert log['pf'] == os.path.join(self.path, f"{log['rid']}.prof")
+
+        with pytest.raises(ValueError):
+            ProfileConfig(rate=2)
+
+    def test_one_at_a_time(self):
+        profiler.configure(ProfileConfig(rate=1, path=self.path))
+        with profiler._lock:  # pylint: disable=protected-access
+            assert 'pf' not in self.get()
@@ -0,0 +1,53 @@
+from datetime import datetime
+import json
+from unittest import TestCase
+from unittest.mock import patch
+import pytz
+
+from mozi.api import FastJSONResponse
+from mozi.api.app import app
+from mozi.api.responses import dumps
+from tests.test_db.user import User
+
+CREATED_AT = pytz.timezone('Asia/Shanghai').localize(datetime(2024, 4, 25, 14, 26, 22))
+
+
+def make_user(id: int, name: str) -> User:  # pylint: disable=redefined-builtin
+    return User(id=id, name=name, created_at=CREATED_AT, updated_at=CREATED_AT)
+
+
+class TestDumps(TestCase):
+
+    def test_models(self):
+        data = json.loads(dumps(make_user(1, 'foo')))
+        assert data['id'] == 1
+        assert data['name'] == 'foo'
+        assert datetime.fromisoformat(data['created_at']) == CREATED_AT
+
+        data = json.loads(dumps([make_user(1, 'foo'), make_user(2, 'bar')]))
+        assert [u['name'] for u in data] == ['foo', 'bar']
+
+    def test_content(self):
+        content = {'total': 1, 'users': [make_user(1, 'foo')], 'at': CREATED_AT, 1: None}
+        expected = {
+            'total': 1,
+            'users': [json.loads(dumps(make_user(1, 'foo')))],
+            'at': CREATED_AT.isoformat(),
+            '1': None,
+        }
+        assert json.loads(dumps(content)) == expected
+
+        with patch('mozi.api.responses.orjson', None):
+            assert json.loads(dumps(content)) == expected
+
+        with self.assertRaises(TypeError):
+            dumps({'x': object()})
+
+    def test_response(self):
+        response = FastJSONResponse([make_user(1, 'foo')])
+        assert response.media_type == 'application/json'
+        assert json.loads(response.body)[0]['name'] == 'foo'
+
+
+def test_default_response_class():
+    assert app.router.default_response_class is FastJSONResponse
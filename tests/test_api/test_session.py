@@ -0,0 +1,48 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from . import client
+from .main import app
+
+
+class TestSessionDependency(TestCase):
+
+    def test_commit_and_rollback(self):
+        count = client.get("/db/users").json()["count"]
+
+        assert client.post("/db/users", params={'name': 'session-foo'}).status_code == 200
+        assert client.get("/db/users").json()["count"] == count + 1
+
+        response = client.post("/db/users", params={'name': 'session-bar', 'fail': True})
+        assert response.status_code == 400
+        assert client.get("/db/users").json()["count"] == count + 1
+
+    def test_commit_error(self):
+        # the INSERT only runs at commit, which happens before the response is sent
+        count = client.get("/db/users").json()["count"]
+        assert client.post("/db/users", params={'name': 'session-dup'}).status_code == 200
+
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            response = TestClient(app, raise_server_exceptions=False).post(
+                "/db/users", params={'name': 'session-dup'}
+            )
+        assert response.status_code == 500
+        assert client.get("/db/users").json()["count"] == count + 1
+
+        log = json.loads(str(mock_logger.error.call_args.args[0]))
+        assert log["c"] == 500
+        assert log["dq"] == 1  # the failed commit
+        assert log["dt"] > 0
+
+    def test_query_stats_logged(self):
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            client.get("/db/users")
+            client.get("/db/nodb")
+
+        users, nodb = [json.loads(str(c.args[0])) for c in mock_logger.info.call_args_list]
+        assert users["dq"] == 2  # SELECT and COMMIT
+        assert users["dt"] >= 0
+        assert nodb["dq"] == 0
+        assert nodb["dt"] == 0
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import pytest
+
+from mozi.api import ExportResponse
+from mozi.tracing import set_exporter
+from . import client
+
+
+class TestStreaming(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        for i in range(5):
+            client.post("/db/users", params={'name': f'stream-{i}'})
+        cls.count = client.get("/db/users").json()["count"]
+
+    def test_ndjson(self):
+        response = client.get("/db/export/ndjson")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == self.count
+        assert [r["id"] for r in rows] == sorted(r["id"] for r in rows)
+
+    def test_json_array(self):
+        rows = client.get("/db/export/json").json()
+        assert len(rows) == self.count
+        assert {"stream-0", "stream-4"} <= {r["name"] for r in rows}
+
+        assert len(client.get("/db/export/json", params={'chunk_size': 1000}).json()) == self.count
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(client.get("/db/export/csv").text)))
+        assert len(rows) == self.count
+        assert {"id", "name", "uuid"} <= set(rows[0])
+
+    def test_logged_once_completed(self):
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            response = client.get("/db/export/ndjson")
+
+        assert mock_logger.info.call_count == 1
+        log = json.loads(str(mock_logger.info.call_args.args[0]))
+        assert log["c"] == 200
+        assert log["sr"] == self.count
+        assert log["sb"] == len(response.content)
+        assert log["dq"] == self.count // 2 + 1
+        assert log["t"] >= 0
+
+    def test_traced(self):
+        exporter = Mock()
+        set_exporter(exporter)
+        try:
+            response = client.get("/db/export/ndjson")
+        finally:
+            set_exporter(None)
+
+        trace = exporter.export.call_args.args[0]
+        export, root = trace.spans[-2:]
+        assert root.name == 'GET /db/export/{fmt}'
+        assert export.name == 'export'
+        assert export.parent_id == root.span_id
+        assert export.attributes == {'export.rows': self.count,
+                                     'export.bytes': len(response.content)}
+        assert export.queries >= self.count // 2
+        assert root.start_ns <= export.start_ns <= export.end_ns <= root.end_ns
+
+
+def test_abstract_export():
+    class NoEncode(ExportResponse):  # pylint: disable=abstract-method
+        pass
+
+    with pytest.raises(TypeError):
+        NoEncode(Mock(), [], media_type='text/plain')  # pylint: disable=abstract-class-instantiated
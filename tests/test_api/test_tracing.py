@@ -0,0 +1,52 @@
+import json
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from mozi.tracing import REQUEST_ID_HEADER, set_exporter
+from . import client
+
+
+class TestRequestTracing(TestCase):
+
+    def tearDown(self):
+        set_exporter(None)
+
+    def test_request_id(self):
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            response = client.get("/db/users", headers={REQUEST_ID_HEADER: 'req-1'})
+            generated = client.get("/db/users").headers[REQUEST_ID_HEADER]
+
+        assert response.headers[REQUEST_ID_HEADER] == 'req-1'
+        assert len(generated) == 26
+        logs = [json.loads(str(c.args[0])) for c in mock_logger.info.call_args_list]
+        assert [log["rid"] for log in logs] == ['req-1', generated]
+
+    def test_error_request_id(self):
+        with patch('mozi.api.api_logger.logger') as mock_logger:
+            api_error = client.get("/demo/error", headers={REQUEST_ID_HEADER: 'req-err'})
+            invalid = client.get("/demo/validate", params={'limit': 'abc'},
+                                 headers={REQUEST_ID_HEADER: 'req-422'})
+
+        assert api_error.status_code == 400
+        assert api_error.headers[REQUEST_ID_HEADER] == 'req-err'
+        assert invalid.status_code == 422
+        assert invalid.headers[REQUEST_ID_HEADER] == 'req-422'
+        logs = [json.loads(str(c.args[0])) for c in mock_logger.error.call_args_list]
+        assert [log["rid"] for log in logs] == ['req-err', 'req-422']
+
+    def test_spans(self):
+        exporter = Mock()
+        set_exporter(exporter)
+        client.get("/db/traced", headers={REQUEST_ID_HEADER: 'req-2'})
+
+        trace = exporter.export.call_args.args[0]
+        child, root = trace.spans
+        assert trace.request_id == 'req-2'
+        assert root.name == 'GET /db/traced'
+        assert root.parent_id is None
+        assert child.name == 'count_users'
+        assert child.parent_id == root.span_id
+        assert child.attributes == {'table': 'user'}
+        assert child.queries == 1
+        assert trace.queries >= 1
+        assert root.start_ns <= child.start_ns <= child.end_ns <= root.end_ns
@@ -0,0 +1,72 @@
+import os
+from dataclasses import dataclass
+from unittest import TestCase, mock
+
+from mozi.config import EMPTY, Config, load_config
+from mozi.utils import freeze, get_config
+
+
+@dataclass
+class Api:
+    docs: bool = True
+    title: str = ''
+
+
+class TestConfig(TestCase):
+
+    def setUp(self) -> None:
+        self.config_path = f"{os.getenv('APP_PATH', '')}/tests/data"
+        self.files = [f"{self.config_path}/config.yml", f"{self.config_path}/tmp.yml"]
+
+    def test_section(self):
+        config = Config(self.files, environ={})
+        assert config.keys() == ['logging']
+        assert 'logging' in config
+        assert config.section('logging') == freeze(get_config(self.files, 'logging'))
+        assert config.section('logging') is config.section('logging')
+        assert config.section('missing') is EMPTY
+        assert config.to_dict() == {'logging': config.section('logging')}
+
+        with self.assertRaises(TypeError):
+            config.section('logging')['log_path'] = '/tmp'  # type: ignore
+
+    def test_lazy(self):
+        config = Config(self.files, environ={})
+        with mock.patch('mozi.config._construct') as mock_construct:
+            config.section('missing')
+            mock_construct.assert_not_called()
+
+    def test_env_overlay(self):
+        environ = {
+            'MOZI_LOGGING__LOG_PATH': '/var/log/app',
+            'MOZI_API__DOCS': 'false',
+            'MOZI_API__TITLE': 'demo',
+            'MOZI_LIMIT': '10',
+            'OTHER_API__DOCS': 'true',
+        }
+        config = Config(self.files, environ=environ)
+        assert config.section('logging')['log_path'] == '/var/log/app'
+        loggers = freeze(get_config(self.files, 'logging')['loggers'])
+        assert config.section('logging')['loggers'] == loggers
+        assert config.section('api') == {'docs': False, 'title': 'demo'}
+        assert config.section('limit') == 10
+
+        api = config.section('api', Api)
+        assert api == Api(docs=False, title='demo')
+        assert config.section('api', Api) is api
+
+        assert 'api' not in Config(self.files, env_prefix=None, environ=environ)
+        config = Config(self.files, env_prefix='OTHER_', environ=environ)
+        assert config.section('api') == {'docs': True}
+
+    def test_not_mapping(self):
+        path = '/tmp/mozi-config-list.yml'
+        with open(path, 'w', encoding='utf-8') as config_file:
+            config_file.write('- a\n- b\n')
+        with self.assertRaises(ValueError):
+            Config([path])
+        os.remove(path)
+
+    def test_load_config(self):
+        assert load_config(self.files) is load_config(list(self.files))
+        assert load_config(self.files) is not load_config(self.files[:1])
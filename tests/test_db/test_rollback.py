@@ -0,0 +1,34 @@
+from unittest.mock import patch
+from mozi.db import RollbackTestCase, TestDatabase
+from .user import User
+
+
+class TestRollbackTestCase(RollbackTestCase):
+
+    def test_a_create(self):
+        user = User.create(self.session, name='foo')
+        assert user.id == 1
+        assert User.count(self.session) == 1
+
+        # a failed commit only rolls back the savepoint
+        with self.assertRaises(Exception):
+            User.create(self.session, name='foo')
+        assert User.count(self.session) == 1
+
+    def test_b_rolled_back(self):
+        assert User.count(self.session) == 0
+        assert User.create(self.session, name='foo').id == 1
+
+
+def test_schema_created_once():
+    database = TestDatabase()
+    with patch('mozi.db.create_db_and_tables', wraps=lambda e: None) as mock_create:
+        for _ in range(3):
+            database.rollback(database.session())
+        assert mock_create.call_count == 1
+
+
+def test_worker_url():
+    with patch.dict('os.environ', {'PYTEST_XDIST_WORKER': 'gw1'}):
+        database = TestDatabase('sqlite:////dev/shm/mozi-test-{worker}.db')
+    assert database.url == 'sqlite:////dev/shm/mozi-test-gw1.db'
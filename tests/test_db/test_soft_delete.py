@@ -0,0 +1,104 @@
+from datetime import timedelta
+from sqlalchemy import inspect, select as sa_select
+from sqlmodel import Field, Session, SQLModel
+
+from mozi.db import (
+    RollbackTestCase, SoftDeleteModel, archive_metadata, live_index, soft_delete_index
+)
+from mozi.utils import now
+from .base import DBTestCase
+
+
+class Note(SoftDeleteModel, table=True):
+    __tablename__ = "notes"
+    __table_args__ = (
+        soft_delete_index('notes'),
+        live_index('ix_notes_topic_live', 'topic'),
+    )
+
+    topic: str = Field(default='')
+
+
+class Memo(SoftDeleteModel, table=True):
+    __tablename__ = "memos"
+
+
+class TestSoftDeleteModel(DBTestCase):
+
+    def tearDown(self):
+        archive_metadata.drop_all(self.engine)
+        return super().tearDown()
+
+    def create_notes(self, session: Session, count: int):
+        return [Note.create(session, topic=f'topic-{i % 2}') for i in range(count)]
+
+    def test_delete(self):
+        with Session(self.engine) as session:
+            first, second, third = self.create_notes(session, 3)
+            first.delete(session)
+            assert first.deleted_at is not None
+
+            assert Note.get_by_id(session, first.id) is None
+            assert Note.get_by_id(session, first.id, with_deleted=True) is first
+            assert Note.gets_by_ids(session, [first.id, second.id], ordered=True) == [None, second]
+            assert Note.gets_by_ids(session, [1, 2, 3], with_deleted=True, workers=2) == [
+                first, second, third
+            ]
+            assert Note.count(session) == 2
+            assert Note.count(session, with_deleted=True) == 3
+            assert Note.count(session, topic='topic-0') == 1
+            assert Note.all(session, order_by='id') == [second, third]
+            assert Note.get(session, topic='topic-0') is third
+            assert Note.get_for_update(session, first.id) is None
+            assert [n.id for c in Note.iter_chunks(session, chunk_size=1) for n in c] == [2, 3]
+            assert Note.gets(session) == (2, [second, third])
+
+            first.restore(session)
+            assert Note.count(session) == 3
+
+            first.hard_delete(session)
+            assert Note.count(session, with_deleted=True) == 2
+
+    def test_indexes(self):
+        indexes = {i['name']: i for i in inspect(self.engine).get_indexes('notes')}
+        assert indexes['ix_notes_deleted_at_id']['column_names'] == ['deleted_at', 'id']
+        assert indexes['ix_notes_topic_live']['dialect_options']['sqlite_where'].text == \
+            'deleted_at IS NULL'
+        assert [i['name'] for i in inspect(self.engine).get_indexes('memos')] == [
+            'ix_memos_deleted_at_id'
+        ]
+
+    def test_archive(self):
+        with Session(self.engine) as session:
+            notes = self.create_notes(session, 7)
+            for note in notes[:5]:
+                note.delete(session)
+            notes[0].update(session, deleted_at=now() + timedelta(days=1))
+
+            # pending work of the caller is left to it
+            session.add(Note(topic='pending'))
+            assert Note.archive(session, before=now(), chunk_size=2) == 4
+            session.rollback()
+            assert Note.archive(session, before=now()) == 0
+            assert Note.count(session, with_deleted=True) == 3
+
+            archive = Note.archive_table()
+            rows = session.execute(sa_select(archive).order_by(archive.c.id)).all()
+            assert [r.id for r in rows] == [2, 3, 4, 5]
+            assert all(r.deleted_at is not None and r.archived_at is not None for r in rows)
+
+        assert archive.name not in SQLModel.metadata.tables
+
+
+class TestArchiveRollback(RollbackTestCase):
+
+    def test_archive(self):
+        notes = [Note.create(self.session, topic='rollback') for _ in range(3)]
+        notes[0].delete(self.session)
+        notes[1].delete(self.session)
+
+        # chunks are savepoints of the test transaction, rolled back with it
+        assert Note.archive(self.session, before=now(), chunk_size=1) == 2
+        assert Note.count(self.session, with_deleted=True) == 1
+        archive = Note.archive_table()
+        assert len(self.session.execute(sa_select(archive)).all()) == 2
@@ -219,3 +219,46 @@ class TestUser(DBTestCase):
                 )
             )
             assert [u.name for u in users] == ['bar']
+
+    def test_gets_by_ids_chunked(self):
+        with Session(self.engine) as session:
+            for name in ['foo', 'bar', 'baz', 'qux', 'quux']:
+                User.create(session, name=name)
+
+            with patch('mozi.db.max_params', return_value=2):
+                users = User.gets_by_ids(session, [5, 1, 2, 3, 4])
+                assert sorted(u.name for u in users) == ['bar', 'baz', 'foo', 'quux', 'qux']
+
+                users = User.gets_by_ids(session, [5, 9, 1, 5], ordered=True)
+                assert [u.name if u else None for u in users] == ['quux', None, 'foo', 'quux']
+
+                users = User.gets_by_ids(session, [5, 4, 3, 2, 1, 6], ordered=True, workers=3)
+                assert [u.name if u else None for u in users] == ['quux', 'qux', 'baz', 'bar', 'foo', None]  # pylint: disable=line-too-long
+                assert all(u in session for u in users if u)
+
+    def test_gets_by_ids_connection_bind(self):
+        with self.engine.connect() as connection, Session(bind=connection) as session:
+            for name in ['foo', 'bar', 'baz']:
+                session.add(User(name=name))
+            session.flush()
+
+            # the connection cannot be shared by worker threads, chunks run in turn
+            with patch('mozi.db.max_params', return_value=2), \
+                    patch('mozi.db.ThreadPoolExecutor') as executor:
+                users = User.gets_by_ids(session, [3, 2, 1], ordered=True, workers=3)
+            executor.assert_not_called()
+            assert [u.name for u in users] == ['baz', 'bar', 'foo']  # type: ignore
+
+    def test_iter_chunks(self):
+        with Session(self.engine) as session:
+            for name in ['foo', 'bar', 'baz', 'qux', 'quux', 'corge']:
+                User.create(session, name=name)
+
+            chunks = list(User.iter_chunks(session, chunk_size=3))
+            assert [len(chunk) for chunk in chunks] == [3, 3]
+            assert [u.name for chunk in chunks for u in chunk] == ['foo', 'bar', 'baz', 'qux', 'quux', 'corge']  # pylint: disable=line-too-long
+
+            chunks = list(User.iter_chunks(session, chunk_size=4, filter_factory=lambda s: s.where(User.id > 1)))  # pylint: disable=line-too-long
+            assert [len(chunk) for chunk in chunks] == [4, 1]
+
+            assert not list(User.iter_chunks(session, name='not-exists'))
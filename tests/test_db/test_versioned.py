@@ -0,0 +1,73 @@
+from sqlmodel import Field, Session
+from mozi.db import VersionConflictError, VersionedModel, retry_on_conflict
+from .base import DBTestCase
+
+
+class Counter(VersionedModel, table=True):
+    __tablename__ = "counters"
+
+    value: int = Field(default=0)
+
+
+class TestVersionedModel(DBTestCase):
+
+    def test_version_bump(self):
+        with Session(self.engine) as session:
+            counter = Counter.create(session)
+            assert counter.version == 1
+
+            counter.update(session, value=1)
+            assert counter.version == 2
+            assert counter.value == 1
+
+    def test_conflict(self):
+        Counter.create(Session(self.engine))
+
+        with Session(self.engine) as s1, Session(self.engine) as s2:
+            c1 = Counter.get_by_id(s1, 1)
+            c2 = Counter.get_by_id(s2, 1)
+
+            c1.update(s1, value=1)
+            with self.assertRaises(VersionConflictError):
+                c2.update(s2, value=2)
+
+        with Session(self.engine) as s1, Session(self.engine) as s2:
+            c1 = Counter.get_by_id(s1, 1)
+            c2 = Counter.get_by_id(s2, 1)
+
+            c1.update(s1, value=3)
+            with self.assertRaises(VersionConflictError):
+                c2.delete(s2)
+
+        with Session(self.engine) as session:
+            counter = Counter.get_by_id(session, 1)
+            assert counter.value == 3
+            assert counter.version == 3
+
+    def test_retry_on_conflict(self):
+        Counter.create(Session(self.engine))
+        calls = []
+
+        @retry_on_conflict(retries=3)
+        def incr():
+            with Session(self.engine) as session:
+                counter = Counter.get_by_id(session, 1)
+                if not calls:
+                    # a concurrent writer updates the row first
+                    with Session(self.engine) as other:
+                        Counter.get_by_id(other, 1).update(other, value=10)
+                calls.append(1)
+                return counter.update(session, value=counter.value + 1).value
+
+        assert incr() == 11
+        assert len(calls) == 2
+
+        @retry_on_conflict(retries=2)
+        def always_conflict():
+            calls.append(1)
+            raise VersionConflictError()
+
+        calls.clear()
+        with self.assertRaises(VersionConflictError):
+            always_conflict()
+        assert len(calls) == 2
@@ -0,0 +1,166 @@
+import gzip
+import logging
+import multiprocessing
+import os
+import shutil
+from unittest import TestCase
+
+from mozi.handlers import (
+    CompressedRotatingFileHandler, CompressedTimedRotatingFileHandler,
+    MultiProcessRotatingFileHandler, enforce_total_size, worker
+)
+from mozi.utils import clear_ensured_dirs, ensure_dir
+
+
+class HandlerTestCase(TestCase):
+
+    def setUp(self):
+        self.log_dir = ensure_dir('/tmp/mozi-handlers')
+        self.log_file = f'{self.log_dir}/app.log'
+        self.handlers = []
+        return super().setUp()
+
+    def tearDown(self):
+        for handler in self.handlers:
+            handler.close()
+        worker.join()
+        shutil.rmtree(self.log_dir)
+        clear_ensured_dirs()
+        return super().tearDown()
+
+    def emit(self, handler: logging.Handler, *messages: str):
+        self.handlers.append(handler)
+        for message in messages:
+            handler.emit(logging.makeLogRecord({'msg': message}))
+
+    def files(self) -> list:
+        return sorted(os.listdir(self.log_dir))
+
+
+class TestCompressedRotatingFileHandler(HandlerTestCase):
+
+    def test_gzip(self):
+        handler = CompressedRotatingFileHandler(self.log_file, compress='gzip',
+                                                maxBytes=10, backupCount=3)
+        self.emit(handler, 'first line', 'second line', 'third line')
+        worker.join()
+
+        files = self.files()
+        assert files[0] == 'app.log'
+        assert all(f.endswith('.gz') for f in files[1:])
+
+        lines = []
+        for name in reversed(files[1:]):
+            with gzip.open(f'{self.log_dir}/{name}', 'rt') as f:
+                lines.append(f.read())
+        with open(self.log_file, encoding='utf-8') as f:
+            lines.append(f.read())
+        assert ''.join(lines) == 'first line\nsecond line\nthird line\n'
+
+    def test_max_total_bytes(self):
+        handler = CompressedRotatingFileHandler(self.log_file, maxBytes=10, backupCount=10,
+                                                maxTotalBytes=25)
+        self.emit(handler, *[f'line {i:05d}' for i in range(5)])
+        worker.join()
+
+        # every segment is 11 bytes, only two fit into 25 bytes
+        assert self.files() == ['app.log', 'app.log.1', 'app.log.2']
+
+    def test_invalid_compress(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown compression'):
+            CompressedRotatingFileHandler(self.log_file, compress='rar')
+
+
+class TestCompressedTimedRotatingFileHandler(HandlerTestCase):
+
+    def test_rollover(self):
+        handler = CompressedTimedRotatingFileHandler(self.log_file, compress='gzip', when='S')
+        self.emit(handler, 'first line')
+        handler.doRollover()
+        worker.join()
+
+        files = self.files()
+        assert len(files) == 2
+        assert files[1].startswith('app.log.') and files[1].endswith('.gz')
+
+
+def test_enforce_total_size():
+    log_dir = ensure_dir('/tmp/mozi-retention')
+    try:
+        names = ['app.log.lock', 'app.log', 'app.log.3', 'app.log.2', 'app.log.1', 'other.log']
+        for i, name in enumerate(names):
+            path = f'{log_dir}/{name}'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('x' * 10)
+            os.utime(path, (i, i))
+
+        enforce_total_size(f'{log_dir}/app.log', 20)
+        assert sorted(os.listdir(log_dir)) == [
+            'app.log', 'app.log.1', 'app.log.2', 'app.log.lock', 'other.log'
+        ]
+    finally:
+        shutil.rmtree(log_dir)
+        clear_ensured_dirs()
+
+
+def write_lines(log_file: str, writer: int, count: int):
+    handler = MultiProcessRotatingFileHandler(log_file, maxBytes=2048, backupCount=1000)
+    for i in range(count):
+        handler.emit(logging.makeLogRecord({'msg': f'{writer}-{i}'}))
+    handler.close()
+
+
+class TestMultiProcessRotatingFileHandler(HandlerTestCase):
+
+    def read_lines(self) -> list:
+        lines = []
+        for name in self.files():
+            if not name.endswith('.lock'):
+                with open(f'{self.log_dir}/{name}', encoding='utf-8') as f:
+                    lines.extend(f.read().splitlines())
+        return lines
+
+    def test_rotate(self):
+        handler = MultiProcessRotatingFileHandler(self.log_file, maxBytes=12, backupCount=2)
+        self.emit(handler, 'line 00001', 'line 00002', 'line 00003', 'line 00004')
+
+        assert self.files() == ['app.log', 'app.log.1', 'app.log.2', 'app.log.lock']
+        assert sorted(self.read_lines()) == ['line 00002', 'line 00003', 'line 00004']
+
+        handler = MultiProcessRotatingFileHandler(self.log_file, maxBytes=12)
+        self.emit(handler, 'line 00005', 'line 00006')
+        with open(self.log_file, encoding='utf-8') as f:
+            assert f.read() == 'line 00006\n'
+
+    def test_reopen_after_other_rotation(self):
+        writer_a = MultiProcessRotatingFileHandler(self.log_file, maxBytes=24, backupCount=2)
+        writer_b = MultiProcessRotatingFileHandler(self.log_file, maxBytes=24, backupCount=2)
+        self.emit(writer_a, 'line a0001', 'line a0002')
+        self.emit(writer_b, 'line b0001')  # rotates, a's file is now app.log.1
+        self.emit(writer_a, 'line a0003')
+
+        with open(self.log_file, encoding='utf-8') as f:
+            assert f.read() == 'line b0001\nline a0003\n'
+        with open(f'{self.log_file}.1', encoding='utf-8') as f:
+            assert f.read() == 'line a0001\nline a0002\n'
+
+        os.remove(self.log_file)
+        self.emit(writer_b, 'line b0002')
+        with open(self.log_file, encoding='utf-8') as f:
+            assert f.read() == 'line b0002\n'
+
+    def test_multi_process_no_line_loss(self):
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=write_lines, args=(self.log_file, writer, 500))
+            for writer in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        lines = self.read_lines()
+        assert len(lines) == 2000
+        assert set(lines) == {f'{w}-{i}' for w in range(4) for i in range(500)}
+        assert len(self.files()) > 2
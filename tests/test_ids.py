@@ -0,0 +1,49 @@
+import base64
+import hashlib
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import pytest
+
+from mozi.ids import (
+    ENCODING, RANDOM_BITS, ULIDGenerator, decode, short_hash, ulid, ulid_time, ulids, uuids
+)
+
+
+def test_short_hash():
+    for length in range(1, 50):
+        digest = hashlib.sha256(b'hello world').digest()
+        expected = base64.urlsafe_b64encode(digest).decode()[:length]
+        assert short_hash('hello world', length) == expected
+
+    assert uuids(['hello world', 'foo'], length=4) == ['uU0n', short_hash('foo', 4)]
+
+
+def test_ulid():
+    values = ulids(1000)
+    assert len(set(values)) == 1000
+    assert values == sorted(values)
+    assert all(len(v) == 26 and set(v) <= set(ENCODING) for v in values)
+
+    now = datetime.now(tz=timezone.utc)
+    assert abs(ulid_time(ulid()) - now) < timedelta(seconds=1)
+
+    with pytest.raises(ValueError):
+        decode('0' * 25)
+    with pytest.raises(ValueError):
+        decode('U' * 26)
+
+
+def test_ulid_monotonic():
+    generator = ULIDGenerator()
+    with mock.patch('mozi.ids.time.time_ns', return_value=1716540253587 * 1_000_000):
+        first, second = generator.new(), generator.new()
+        assert decode(second) == decode(first) + 1
+        assert decode(first) >> RANDOM_BITS == 1716540253587
+
+        # clock going back does not break the order
+        with mock.patch('mozi.ids.time.time_ns', return_value=1716540253000 * 1_000_000):
+            assert generator.new() > second
+
+        # overflow of the random part moves on to the next millisecond
+        generator._last_random = (1 << RANDOM_BITS) - 1  # pylint: disable=protected-access
+        assert decode(generator.new()) >> RANDOM_BITS == 1716540253588
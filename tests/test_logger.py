@@ -1,10 +1,14 @@
+import logging
 import os
-from unittest import TestCase
+import time
+from unittest import TestCase, mock
 import pytest
+from mozi.tracing import TraceFilter, trace
 from mozi.utils import sort_list
 from mozi.logger import (
-    DEFAULT_FORMAT, DEFAULT_LOG_DIR, MAX_FILE_SIZE, Formatter, HandlerEnum, LoggerConfig,
-    LoggerItem, LoggerLoader, RotateConfig, get_logger
+    DEFAULT_FORMAT, DEFAULT_LOG_DIR, MAX_FILE_SIZE, Formatter, HandlerEnum, LazyJSON,
+    LoggerConfig, LoggerItem, LoggerLoader, RateLimitConfig, RateLimitFilter, RotateConfig,
+    SamplingConfig, SamplingFilter, SamplingRule, get_logger, log_json, pre_filter
 )
 
 
@@ -42,6 +46,26 @@ class TestRotateConfig(TestCase):
         assert rotate_config.max_bytes == 204800
         assert rotate_config.backup_count == 10
 
+    def test_to_dict(self):
+        assert RotateConfig(max_bytes=1024).to_dict() == {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'maxBytes': 1024,
+            'backupCount': 5,
+        }
+        assert RotateConfig(compress='gzip', max_total_bytes=4096).to_dict() == {
+            'class': 'mozi.handlers.CompressedRotatingFileHandler',
+            'maxBytes': MAX_FILE_SIZE,
+            'backupCount': 5,
+            'compress': 'gzip',
+            'maxTotalBytes': 4096,
+        }
+        assert RotateConfig(when='midnight', backup_count=7).to_dict() == {
+            'class': 'mozi.handlers.CompressedTimedRotatingFileHandler',
+            'when': 'midnight',
+            'interval': 1,
+            'backupCount': 7,
+        }
+
 
 class TestLoggerItemInitialize(TestCase):
     def test_default_values(self):
@@ -250,6 +274,24 @@ class TestLoggerItemHandlers(TestCase):
             }
         })
 
+    def test_mp_rotate_handler(self):
+        logger = LoggerItem('app', handlers=[HandlerEnum.MP_ROTATE], log_path='/tmp/logs/custom')
+        self.assertDictEqual(logger.get_handlers_dict(), {
+            'mp_rotate-oXLO3K5HR0': {
+                'class': 'mozi.handlers.MultiProcessRotatingFileHandler',
+                'level': 'INFO',
+                'formatter': 'default',
+                'filename': '/tmp/logs/custom/app.log',
+                'maxBytes': 104857600,
+                'backupCount': 5,
+            }
+        })
+
+    def test_mp_rotate_options(self):
+        for rotate_cnf in [{'compress': 'gzip'}, {'when': 'midnight'}, {'max_total_bytes': 1024}]:
+            with pytest.raises(ValueError):
+                LoggerItem('app', handlers=[HandlerEnum.MP_ROTATE], rotate_cnf=rotate_cnf)
+
     def test_get_handlers_dict(self):
         hargs = [HandlerEnum.ERROR, HandlerEnum.CONSOLE, HandlerEnum.FILE, HandlerEnum.ROTATE]
         logger = LoggerItem('app', handlers=hargs)
@@ -472,3 +514,228 @@ class TestLoggerLoader(TestCase):
         config = LoggerLoader([f'{self.config_path}/tmp.yml'], log_path=log_path).load()
         for logger in config.loggers:
             assert logger.log_path == log_path
+
+    def test_load_filters(self):
+        with open(self.empty_file, 'w', encoding='utf-8') as f:
+            f.write("""
+logging:
+  loggers:
+    sampled:
+      sampling:
+        default: 0.5
+        slow_ms: 1000
+        rules:
+          - {route: /health, status: 2xx, rate: 0.01}
+          - {status: 5xx, rate: 1}
+      rate_limit: {rate: 100, burst: 200}
+""")
+        config = LoggerLoader([self.empty_file]).load()
+        item = config.loggers[0]
+        assert item.sampling == SamplingConfig(default=0.5, slow_ms=1000, rules=[
+            SamplingRule(route='/health', status='2xx', rate=0.01),
+            SamplingRule(status='5xx', rate=1),
+        ])
+        assert item.rate_limit == RateLimitConfig(rate=100, burst=200)
+
+        filters = get_logger('sampled').filters
+        assert [type(f) for f in filters] == [SamplingFilter, RateLimitFilter]
+        assert filters[0].rate('/health', 200) == 0.01
+
+    def test_trace_filter(self):
+        config = """
+logging:
+  formatters:
+    default:
+      format: "%(request_id)s %(message)s"
+  loggers:
+    traced:
+      level: {level}
+      handlers: [console]
+      trace: true
+"""
+        with open(self.empty_file, 'w', encoding='utf-8') as f:
+            f.write(config.format(level='INFO'))
+        LoggerLoader([self.empty_file]).load()
+        handler = get_logger('traced').handlers[0]
+        [trace_filter] = handler.filters
+        assert isinstance(trace_filter, TraceFilter)
+
+        # records of child loggers pass the handler filter too
+        record = logging.makeLogRecord({'name': 'traced.child', 'msg': 'x'})
+        with trace('job', request_id='r1'):
+            assert handler.filter(record)
+        assert handler.format(record) == 'r1 x'
+
+        with open(self.empty_file, 'w', encoding='utf-8') as f:
+            f.write(config.format(level='DEBUG'))
+        LoggerLoader([self.empty_file]).load()
+        assert get_logger('traced').handlers[0] is handler
+        assert handler.filters == [trace_filter]
+
+    def write_config(self, level: str = 'INFO', fmt: str = '%(message)s', extra: str = ''):
+        with open(self.empty_file, 'w', encoding='utf-8') as f:
+            f.write(f"""
+logging:
+  log_path: /tmp/mozi-reload
+  formatters:
+    default:
+      format: "{fmt}"
+  loggers:
+    reload.stable:
+      handlers: [rotate]
+    reload.changed:
+      level: {level}
+      handlers: [rotate, console]
+      rate_limit: {{rate: 100, burst: 200}}
+{extra}
+""")
+
+    def test_reload(self):
+        self.write_config()
+        LoggerLoader([self.empty_file]).load()
+        stable, changed = get_logger('reload.stable'), get_logger('reload.changed')
+        stable_handler = stable.handlers[0]
+        changed_handlers = {h.name.split('-')[0]: h for h in changed.handlers}  # type: ignore
+        rate_limit = changed.filters[0]
+
+        self.write_config(level='DEBUG', extra="""    reload.added:
+      handlers: [console]""")
+        LoggerLoader([self.empty_file]).load()
+
+        # unchanged handlers and filters are kept open, changed ones are rebuilt
+        assert stable.handlers == [stable_handler]
+        assert stable_handler.stream is not None  # type: ignore
+        assert changed.level == logging.DEBUG
+        handlers = {h.name.split('-')[0]: h for h in changed.handlers}  # type: ignore
+        assert handlers['rotate'] is not changed_handlers['rotate']
+        assert handlers['rotate'].level == logging.DEBUG
+        assert handlers['console'] is changed_handlers['console']
+        assert changed.filters == [rate_limit]
+        assert changed_handlers['rotate'].stream is None  # type: ignore  # closed
+        assert len(get_logger('reload.added').handlers) == 1
+
+        # a changed formatter rebuilds its handlers, dropped loggers are disabled
+        self.write_config(level='DEBUG', fmt='%(levelname)s %(message)s')
+        LoggerLoader([self.empty_file]).load()
+        assert stable.handlers[0] is not stable_handler
+        record = logging.makeLogRecord({'msg': 'x', 'levelname': 'INFO'})
+        assert stable.handlers[0].format(record) == 'INFO x'
+        assert get_logger('reload.added').disabled
+
+        handler = stable.handlers[0]
+        LoggerLoader([self.empty_file]).load(incremental=False)
+        assert stable.handlers[0] is not handler
+        assert not get_logger('reload.added').handlers
+
+
+def make_record(route: str = '/', status: int = 200, latency: float = 1.0) -> logging.LogRecord:
+    record = logging.makeLogRecord({'name': 'mozi-filter-test', 'msg': 'log'})
+    record.api = {'u': route, 'c': status, 't': latency}
+    return record
+
+
+class TestSamplingFilter(TestCase):
+
+    def test_rules(self):
+        sampling = SamplingFilter(default=0.5, slow_ms=1000, rules=[
+            {'route': '/health*', 'status': '2xx', 'rate': 0},
+            {'status': 404, 'rate': 0.1},
+            {'status': '5xx', 'rate': 1},
+        ])
+        assert sampling.rate('/health', 200) == 0
+        assert sampling.rate('/health/db', 204) == 0
+        assert sampling.rate('/health', 500) == 1
+        assert sampling.rate('/users', 404) == 0.1
+        assert sampling.rate('/users', 200) == 0.5
+
+        assert sampling.filter(make_record('/health')) is False
+        assert sampling.filter(make_record('/health', latency=2000)) is True  # slow
+        assert sampling.filter(make_record('/', status=503)) is True
+        assert sampling.filter(logging.makeLogRecord({'msg': 'no api info'})) is True
+
+        with mock.patch('mozi.logger.random.random', return_value=0.3):
+            assert sampling.filter(make_record('/users')) is True
+        with mock.patch('mozi.logger.random.random', return_value=0.7):
+            assert sampling.filter(make_record('/users')) is False
+
+
+class TestRateLimitFilter(TestCase):
+
+    @mock.patch('mozi.logger.time.monotonic')
+    def test_token_bucket(self, mock_time):
+        mock_time.return_value = 100.0
+        limiter = RateLimitFilter(rate=2, burst=3, summary_interval=10)
+
+        assert [limiter.filter(make_record()) for _ in range(5)] == [True] * 3 + [False] * 2
+        assert limiter.suppressed == 2
+
+        # refill 2 tokens per second
+        mock_time.return_value = 101.0
+        assert [limiter.filter(make_record()) for _ in range(3)] == [True, True, False]
+
+        # summary of suppressed records once the interval elapsed
+        mock_time.return_value = 110.0
+        with mock.patch('mozi.logger.logging.getLogger') as mock_logger:
+            assert limiter.filter(make_record()) is True
+            warning = mock_logger.return_value.warning
+            assert warning.call_count == 1
+            assert warning.call_args.args[1:] == (3, 10)
+        assert limiter.suppressed == 0
+
+    def test_summary_timer(self):
+        limiter = RateLimitFilter(rate=1, burst=1, summary_interval=0.05)
+        with mock.patch('mozi.logger.logging.getLogger') as mock_logger:
+            assert [limiter.filter(make_record()) for _ in range(3)] == [True, False, False]
+            time.sleep(0.2)  # no later record, the timer reports them
+            warning = mock_logger.return_value.warning
+            assert warning.call_count == 1
+            assert warning.call_args.args[1] == 2
+        assert limiter.suppressed == 0
+
+    def test_close(self):
+        limiter = RateLimitFilter(rate=1, burst=1)
+        with mock.patch('mozi.logger.logging.getLogger') as mock_logger:
+            assert limiter.filter(make_record()) is True
+            assert limiter.filter(make_record()) is False
+            limiter.close()
+            assert mock_logger.return_value.warning.call_args.args[1] == 1
+        assert limiter._timer is None  # pylint: disable=protected-access
+
+
+def test_pre_filter():
+    logger = logging.getLogger('mozi-pre-filter-test')
+    sampling = SamplingFilter(default=1, rules=[{'route': '/health', 'rate': 0}])
+    logger.addFilter(sampling)
+    try:
+        assert pre_filter(logger, {'u': '/health', 'c': 200, 't': 1}) is False
+        assert pre_filter(logger, {'u': '/users', 'c': 200, 't': 1}) is True
+        # already sampled, the record filter lets it through
+        record = make_record('/health')
+        record.prefiltered = True
+        assert sampling.filter(record) is True
+    finally:
+        logger.removeFilter(sampling)
+
+
+class TestLazyJSON(TestCase):
+
+    def test_serialised_once(self):
+        with mock.patch('mozi.logger.json.dumps', return_value='{}') as mock_dumps:
+            message = LazyJSON({'a': 1})
+            mock_dumps.assert_not_called()
+            assert str(message) == '{}'
+            assert str(message) == '{}'
+            mock_dumps.assert_called_once_with({'a': 1})
+
+    def test_log_json(self):
+        logger = logging.getLogger('mozi-lazy-test')
+        logger.setLevel(logging.INFO)
+        build = mock.Mock(return_value={'a': 1})
+
+        with self.assertLogs(logger, level='INFO') as logs:
+            assert not log_json(logger, logging.DEBUG, build)
+            build.assert_not_called()
+
+            assert log_json(logger, logging.INFO, build)
+            assert log_json(logger, logging.WARNING, {'b': 2})
+        assert logs.output == ['INFO:mozi-lazy-test:{"a": 1}', 'WARNING:mozi-lazy-test:{"b": 2}']
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+from unittest.mock import Mock
+import pytest
+from sqlalchemy import text
+from sqlmodel import create_engine
+
+from mozi.db import track_queries
+from mozi.handlers import worker
+from mozi.tracing import (
+    FileSpanExporter, TraceFilter, current_span, request_id, set_exporter, span, to_otlp, trace,
+    traced
+)
+
+
+def test_span_outside_trace():
+    with span('idle') as item:
+        assert item is None
+    assert current_span() is None
+    assert request_id() is None
+
+
+def test_nested_spans():
+    with trace('job', request_id='r1', queue='batch') as root:
+        assert request_id() == 'r1'
+        with span('outer') as outer:
+            with span('inner', n=1) as inner:
+                assert current_span() is inner
+            assert current_span() is outer
+        with pytest.raises(ValueError), span('failed'):
+            raise ValueError('boom')
+    assert current_span() is None
+
+    failed = root.trace.spans[2]
+    assert [s.name for s in root.trace.spans] == ['inner', 'outer', 'failed', 'job']
+    assert inner.parent_id == outer.span_id
+    assert outer.parent_id == root.span_id
+    assert failed.error == 'ValueError: boom'
+    assert root.attributes == {'queue': 'batch'}
+    assert inner.duration_ms <= outer.duration_ms <= root.duration_ms
+
+
+def test_traced():
+    @traced()
+    def work():
+        current = current_span()
+        return current.name if current else None
+
+    @traced('async-work')
+    async def async_work():
+        return current_span().name
+
+    with trace('job'):
+        assert work() == 'test_traced.<locals>.work'
+        assert asyncio.run(async_work()) == 'async-work'
+    assert work() is None  # runs untraced outside a trace
+
+
+def test_queries_attributed():
+    engine = track_queries(create_engine('sqlite://'))
+    with trace('job') as root, engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        with span('two') as two:
+            connection.execute(text('SELECT 1'))
+            connection.execute(text('SELECT 1'))
+
+    assert two.queries == 2
+    assert root.queries == 1
+    assert root.trace.queries == 3
+    assert root.trace.query_time >= two.query_time > 0
+
+
+def test_trace_filter():
+    record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg', None, None)
+    log_filter = TraceFilter()
+    assert log_filter.filter(record)
+    fields = vars(record)
+    assert (fields['request_id'], fields['trace_id'], fields['span_id']) == ('-', '-', '-')
+
+    with trace('job', request_id='r2') as root:
+        log_filter.filter(record)
+    assert fields['request_id'] == 'r2'
+    assert fields['trace_id'] == root.trace.trace_id
+    assert fields['span_id'] == root.span_id
+
+
+def test_exporter(tmp_path):
+    path = tmp_path / 'traces' / 'spans.jsonl'
+    set_exporter(FileSpanExporter(path, service_name='demo'))
+    try:
+        for _ in range(2):
+            with trace('job', request_id='r3', size=2), span('step', ratio=0.5, ok=True):
+                pass
+    finally:
+        set_exporter(None)
+    worker.join()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    data = json.loads(lines[0])['resourceSpans'][0]
+    assert data['resource']['attributes'] == [
+        {'key': 'service.name', 'value': {'stringValue': 'demo'}}
+    ]
+    step, root = data['scopeSpans'][0]['spans']
+    assert step['parentSpanId'] == root['spanId']
+    assert 'parentSpanId' not in root
+    assert step['traceId'] == root['traceId']
+    assert root['kind'] == 2
+    assert step['attributes'] == [
+        {'key': 'ratio', 'value': {'doubleValue': 0.5}},
+        {'key': 'ok', 'value': {'boolValue': True}},
+    ]
+    assert root['attributes'] == [
+        {'key': 'size', 'value': {'intValue': '2'}},
+        {'key': 'request.id', 'value': {'stringValue': 'r3'}},
+    ]
+    assert int(root['startTimeUnixNano']) <= int(step['startTimeUnixNano'])
+
+
+def test_to_otlp_error():
+    exporter = Mock()
+    set_exporter(exporter)
+    try:
+        with pytest.raises(KeyError), trace('job'):
+            raise KeyError('x')
+    finally:
+        set_exporter(None)
+
+    spans = to_otlp(exporter.export.call_args.args[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert spans[0]['status'] == {'code': 2, 'message': "KeyError: 'x'"}
@@ -1,9 +1,13 @@
 import os
 import shutil
+import subprocess
+import sys
 from unittest import TestCase, mock
+import pytest
 
 from mozi.utils import (
-    deep_update, ensure_dir, get_config, get_timestamp, hmac_sha256, is_dev, is_prod, is_test,
+    HMACSigner, canonical_hash, canonicalize, clear_ensured_dirs, deep_merge, deep_update,
+    ensure_dir, freeze, get_config, get_timestamp, hmac_sha256, is_dev, is_prod, is_test,
     sort_list, timestamp_to_datetime, utc2datetime, uuid, is_debug
 )
 
@@ -29,6 +33,7 @@ class TestEnsureDir(TestCase):
     def tearDown(self) -> None:
         if os.path.exists(self.tmp_dir):
             shutil.rmtree(self.tmp_dir)
+        clear_ensured_dirs()
 
         return super().tearDown()
 
@@ -57,6 +62,25 @@ class TestEnsureDir(TestCase):
         assert ensure_dir(self.tmp_dir) == self.tmp_dir
         assert os.path.exists(self.tmp_dir)
 
+    def test_parent_is_file(self):
+        file_path = f"{self.test_dir}/__init__.py"
+        with open(file_path, 'a', encoding="utf-8") as f:
+            f.write("foo")
+
+        with self.assertRaises(ValueError):
+            ensure_dir(f"{file_path}/foo")
+
+    def test_cached(self):
+        assert ensure_dir(self.tmp_dir) == self.tmp_dir
+        with mock.patch("os.makedirs") as mock_makedirs:
+            assert ensure_dir(f" {self.tmp_dir}/ ") == self.tmp_dir
+            mock_makedirs.assert_not_called()
+
+        clear_ensured_dirs()
+        with mock.patch("os.makedirs") as mock_makedirs:
+            ensure_dir(self.tmp_dir)
+            mock_makedirs.assert_called_once()
+
     def test_recusion_mkdir(self):
         assert os.path.exists(self.tmp_dir) is False
         director = f"{self.tmp_dir}/foo/bar"
@@ -85,6 +109,30 @@ def test_hmac_sha256():
     assert sig == "8fffb1c6fc8b4afe33b572670f877429a1948233625f9a8c046b40d697f06c23"
 
 
+def test_hmac_signer():
+    signer = HMACSigner("abcdefgh")
+    sig = "8fffb1c6fc8b4afe33b572670f877429a1948233625f9a8c046b40d697f06c23"
+    assert signer.sign("timestamp=1716540253587") == sig
+    assert signer.sign(b"timestamp=1716540253587") == sig
+    assert signer.digest("timestamp=1716540253587").hex() == sig
+
+    messages = [f"timestamp={i}" for i in range(100)]
+    expected = [hmac_sha256("abcdefgh", m) for m in messages]
+    assert signer.sign_many(messages) == expected
+    assert signer.sign_many(messages, workers=4) == expected
+    assert not signer.sign_many([], workers=4)
+
+    assert signer.verify("timestamp=1716540253587", sig)
+    assert signer.verify("timestamp=1716540253587", sig.encode())
+    assert not signer.verify("timestamp=1716540253588", sig)
+    assert not signer.verify("timestamp=1716540253587", "")
+
+    expected[1] = sig
+    assert signer.verify_many(messages, expected, workers=3) == [i != 1 for i in range(100)]
+    with pytest.raises(ValueError):
+        signer.verify_many(messages, expected[:1])
+
+
 def test_uuid():
     sig = uuid('hello world')
     assert sig == "uU0nuZNN"
@@ -121,6 +169,66 @@ class DeepUpdateTestCase(TestCase):
         expected = {'a': {'x': 2}, 'b': 3}
         assert deep_update(dict1, dict2) == expected
 
+    def test_deep_update_deeply_nested(self):
+        dict1, dict2 = {}, {}
+        node1, node2 = dict1, dict2
+        for _ in range(5000):
+            node1 = node1.setdefault('a', {})
+            node2 = node2.setdefault('a', {})
+        node2['x'] = 1
+
+        node = deep_update(dict1, dict2)
+        for _ in range(5000):
+            node = node['a']
+        assert node == {'x': 1}
+
+    def test_deep_update_lists(self):
+        assert deep_update({'a': [1, 2]}, {'a': [3]}) == {'a': [3]}
+        assert deep_update({'a': [1, 2]}, {'a': [3]}, lists='append') == {'a': [1, 2, 3]}
+
+        dict1 = {'a': [{'name': 'x', 'v': 1, 'o': {'p': 1}}, {'name': 'y', 'v': 1}, 0]}
+        dict2 = {'a': [{'name': 'x', 'v': 2, 'o': {'q': 2}}, {'name': 'z'}, 1]}
+        assert deep_update(dict1, dict2, lists='keyed') == {
+            'a': [{'name': 'x', 'v': 2, 'o': {'p': 1, 'q': 2}}, {'name': 'y', 'v': 1}, 0,
+                  {'name': 'z'}, 1]
+        }
+
+        with self.assertRaises(ValueError):
+            deep_update({}, {}, lists='merge')
+
+    def test_deep_merge(self):
+        base = {'a': {'x': 1}, 'b': {'y': 1}, 'l': [{'id': 1, 'v': 1}]}
+        overlay = {'a': {'x': 2}, 'c': {'z': 1}, 'l': [{'id': 1, 'v': 2}, {'id': 2}]}
+        result = deep_merge(base, overlay, lists='keyed', key='id')
+
+        assert result == {'a': {'x': 2}, 'b': {'y': 1}, 'c': {'z': 1},
+                          'l': [{'id': 1, 'v': 2}, {'id': 2}]}
+        # inputs are unchanged, untouched subtrees are shared
+        assert base == {'a': {'x': 1}, 'b': {'y': 1}, 'l': [{'id': 1, 'v': 1}]}
+        assert result['b'] is base['b']
+        assert result['c'] is overlay['c']
+        assert result['a'] is not base['a']
+
+        assert deep_merge(base, {'a': {'w': 0}}, {'a': {'x': 3}})['a'] == {'x': 3, 'w': 0}
+
+    def test_freeze(self):
+        shared = {'x': [1, {'y': 2}]}
+        frozen = freeze({'a': shared, 'b': shared, 'c': 1})
+
+        assert frozen == {'a': {'x': (1, {'y': 2})}, 'b': {'x': (1, {'y': 2})}, 'c': 1}
+        assert frozen['a'] is frozen['b']
+        with self.assertRaises(TypeError):
+            frozen['c'] = 2  # type: ignore
+        with self.assertRaises(TypeError):
+            frozen['a']['x'][1]['y'] = 3  # type: ignore
+        shared['x'] = None
+        assert frozen['a']['x'] == (1, {'y': 2})
+
+        assert freeze(1) == 1
+        result = deep_merge({'a': [1]}, {'a': [2], 'b': {}}, lists='append', frozen=True)
+        assert result == {'a': (1, 2), 'b': {}}
+        assert deep_merge(result, {'a': [3]}, lists='append') == {'a': [1, 2, 3], 'b': {}}
+
 
 class TestYamlConfigFile(TestCase):
 
@@ -215,3 +323,80 @@ def test_sort_list():
     assert sort_list({'a': [3, 2, 1]}) == {'a': [1, 2, 3]}
     assert sort_list({'a': {'b': [3, 2, 1]}}) == {'a': {'b': [1, 2, 3]}}
     assert sort_list({'a': {'b': {'c': [3, 2, 1]}}}) == {'a': {'b': {'c': [1, 2, 3]}}}
+    assert sort_list({'a': [[3, 2], [1]]}) == {'a': [[1], [2, 3]]}
+    assert sort_list({'a': ['b', 1, None, True, 2.5, b'x', 'a']}) == {
+        'a': [None, True, 1, 2.5, 'a', 'b', b'x']
+    }
+
+
+def test_canonicalize():
+    data = [[3, [2, 1]], {'b': [2, 1]}, (2, 1), 'x']
+    assert canonicalize(data) is data
+    assert data[0] == 'x'
+    assert canonicalize([{'b': [1, 2]}, 'x', (2, 1), [[1, 2], 3]]) == data
+
+    nested: list = [2, 1]
+    for _ in range(5000):
+        nested = [nested]
+    canonicalize(nested)
+
+    assert canonicalize(1) == 1
+
+
+def test_canonical_hash():
+    first = {'a': [3, {'x': [2, 1]}, None], 'b': 'text', 'c': 1.5}
+    second = {'c': 1.5, 'b': 'text', 'a': [None, {'x': [1, 2]}, 3]}
+    assert canonical_hash(first) == canonical_hash(second)
+    assert first == second
+
+    assert canonical_hash({'a': 1}) != canonical_hash({'a': '1'})
+    assert canonical_hash({'a': 1}) != canonical_hash({'a': True})
+    assert canonical_hash({'a': [1]}) != canonical_hash({'a': (1,)})
+    assert canonical_hash(['ab', 'c']) != canonical_hash(['a', 'bc'])
+    assert canonical_hash((1, 2)) != canonical_hash((2, 1))
+    assert canonical_hash('x') == canonical_hash('x')
+    assert len(canonical_hash([float('nan'), 1])) == 32
+
+
+def test_canonical_hash_keys_and_sets():
+    assert canonical_hash({(1, 2): 'a', (0,): 'b'}) == canonical_hash({(0,): 'b', (1, 2): 'a'})
+    assert canonical_hash([{(1, 2): 'a'}]) != canonical_hash([{(2, 1): 'a'}])
+    assert canonicalize({'a': [{(1, 2): 1, (0,): 2}]}) == {'a': [{(1, 2): 1, (0,): 2}]}
+
+    assert canonical_hash({'b', 'a', 'c'}) == canonical_hash({'c', 'a', 'b'})
+    assert canonical_hash({'a'}) != canonical_hash(['a'])
+    assert canonical_hash({'a'}) != canonical_hash(frozenset({'a'}))
+    assert canonical_hash([{1, 2}, {frozenset({(1, 'x')}), None}]) == \
+        canonical_hash([{None, frozenset({(1, 'x')})}, {2, 1}])
+
+
+def test_canonicalize_shared_and_order():
+    shared = {'a': 1}
+    data = {'y': [shared, {'b': 2}], 'x': shared}
+    assert canonicalize(data) == {'y': [{'a': 1}, {'b': 2}], 'x': {'a': 1}}
+    pair = (2, 1)
+    assert canonicalize({'x': pair, 'y': [pair, (1, 2)]}) == {'x': (2, 1), 'y': [(1, 2), (2, 1)]}
+    assert canonical_hash({'y': [shared, {'b': 2}], 'x': shared}) == \
+        canonical_hash({'x': {'a': 1}, 'y': [{'b': 2}, {'a': 1}]})
+
+    # containers are ordered by their content, not by their digest
+    assert sort_list({'k': [(2, 'a'), (1, 'b'), (3, 'c')]}) == {'k': [(1, 'b'), (2, 'a'), (3, 'c')]}
+    assert sort_list({'k': [[3, 2], [2], [1, 5], []]}) == {'k': [[], [1, 5], [2], [2, 3]]}
+    assert sort_list({'k': [{'b': 1}, {'a': 2}, {'a': 1}]}) == {
+        'k': [{'a': 1}, {'a': 2}, {'b': 1}]
+    }
+
+    assert canonical_hash(5) != canonical_hash((5,))
+    assert canonical_hash(5) != canonical_hash([5])
+
+
+def test_canonical_hash_seed():
+    # set iteration order changes with the hash seed, the hash must not
+    code = ("from mozi.utils import canonical_hash; "
+            "print(canonical_hash({'x%s' % i for i in range(50)}))")
+    hashes = {
+        subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                       env={**os.environ, 'PYTHONHASHSEED': seed}).stdout
+        for seed in ('1', '2', '3')
+    }
+    assert len(hashes) == 1